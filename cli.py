@@ -10,12 +10,17 @@ import json
 import argparse
 import getpass
 from datetime import datetime
+from urllib.parse import urlparse
 
 from requests import auth
 
 import config
 import ear_logger
+import event_filter
+import event_merger
 import event_processor
+import token_auth
+from xm_instance import Instance
 
 
 def process_events(args):
@@ -23,6 +28,7 @@ def process_events(args):
     ear_logger.get_logger().info(
         'Processing Events only: Range start=%s, Range end=%s',
         args.start, args.end)
+    __apply_plan(args)
     event_processor.get_events(False)
     return
 
@@ -32,10 +38,57 @@ def process_all(args):
     ear_logger.get_logger().info(
         'Processing Events and Notifications: Range start=%s, Range end=%s',
         args.start, args.end)
+    __apply_plan(args)
     event_processor.get_events(True)
     return
 
 
+def process_plan(args):
+    """Called when command line specifies planning a run over a range"""
+    ear_logger.get_logger().info(
+        'Planning Events: Range start=%s, Range end=%s', args.start, args.end)
+    failures = []
+    plans = event_processor.plan_events(
+        args.windows, args.target_minutes * 60, False, failures)
+    if args.plan_filename:
+        with open(args.plan_filename, 'w') as plan_file:
+            plan_file.write(json.dumps(plans, indent=2) + "\n")
+        ear_logger.get_logger().info('Plan written to %s', args.plan_filename)
+    else:
+        sys.stdout.write(json.dumps(plans, indent=2) + "\n")
+    if failures:
+        ear_logger.get_logger().error(
+            "%d of %d instances could not be planned.", len(failures),
+            len(config.instances))
+        sys.exit(failures[0])
+    return
+
+
+def __apply_plan(args):
+    """Sets the instances' worker counts from a plan, if --plan was given
+
+    An instance that cannot be planned keeps its worker count, and any
+    failure to reach it is reported when its events are requested.
+    """
+    if args.plan:
+        event_processor.plan_events(
+            args.windows, args.target_minutes * 60, True, [])
+
+
+def process_merge(args):
+    """Called when command line specifies merging event files"""
+    logger = ear_logger.get_logger()
+    logger.info('Merging %d event files into %s', len(args.inputs),
+                args.output)
+    try:
+        event_merger.merge_files(args.inputs, args.output, args.run_size)
+    except (OSError, ValueError) as exc:
+        logger.error(config.ERR_MERGE_FAILED_MSG, repr(exc))
+        sys.stderr.write(config.ERR_MERGE_FAILED_MSG % repr(exc) + "\n")
+        sys.exit(config.ERR_MERGE_FAILED_CODE)
+    return
+
+
 def __validate_date(test_date):
     """Make sure date is in ISO 8601"""
     if len(test_date) != 23:
@@ -60,6 +113,57 @@ class _CLIError(Exception):
     def __unicode__(self):
         return self.msg
 
+def __verify_instance(instance_cfg, user, password, logger):
+    """Make sure an instance has a URL and credentials, and log them"""
+    if instance_cfg.get('xmodURL'):
+        logger.info("xmatters Instance URL is: %s", instance_cfg['xmodURL'])
+    else:
+        raise(_CLIError(config.ERR_CLI_MISSING_XMOD_URL_MSG,
+                        config.ERR_CLI_MISSING_XMOD_URL_CODE))
+    if instance_cfg.get('user', user):
+        logger.info("User is: %s", instance_cfg.get('user', user))
+    else:
+        raise(_CLIError(config.ERR_CLI_MISSING_USER_MSG,
+                        config.ERR_CLI_MISSING_USER_CODE))
+    if instance_cfg.get('password', password):
+        logger.info("Password was provided.")
+    else:
+        raise(_CLIError(config.ERR_CLI_MISSING_PASSWORD_MSG,
+                        config.ERR_CLI_MISSING_PASSWORD_CODE))
+
+def __create_instance(instance_cfg, user, password, events_base, time_str,
+                      multiple):
+    """Builds the Instance for an entry of the defaults instances list
+
+    When reporting on multiple instances, each one writes its own events
+    file that has the instance name added to the base name.  The digest
+    index used in delta mode has no timestamp, so each run finds the index
+    of the one before.  In token mode, the instance's tokens are cached in
+    a -token.json file alongside it.
+    """
+    xmod_url = instance_cfg['xmodURL']
+    name = instance_cfg.get('name') or urlparse(xmod_url).hostname or xmod_url
+    instance_base = events_base + '-' + name if multiple else events_base
+    events_filename = (
+        instance_base + time_str + '.csv' if multiple
+        else config.events_filename)
+    user = instance_cfg.get('user', user)
+    password = instance_cfg.get('password', password)
+    if instance_cfg.get('auth', config.auth_mode) == 'token':
+        client_id = instance_cfg.get('clientId', config.client_id)
+        if not client_id:
+            raise(_CLIError(config.ERR_CLI_MISSING_CLIENT_ID_MSG % name,
+                            config.ERR_CLI_MISSING_CLIENT_ID_CODE))
+        instance_auth = token_auth.TokenAuth(
+            xmod_url, user, password, client_id,
+            instance_base + '-token.json')
+    else:
+        instance_auth = auth.HTTPBasicAuth(user, password)
+    return Instance(
+        name, xmod_url, instance_auth, events_filename,
+        instance_cfg.get('maxWorkers', config.max_workers),
+        instance_base + '-digest.csv')
+
 class __Password(argparse.Action):
     """Container to get and/or hold incoming password"""
     def __call__(self, parser, namespace, values, option_string): # pylint: disable=signature-differs
@@ -67,7 +171,7 @@ class __Password(argparse.Action):
             values = getpass.getpass()
         setattr(namespace, self.dest, values)
 
-def process_command_line(argv=None, prog_doc=''): # pylint: disable=too-many-branches,too-many-statements
+def process_command_line(argv=None, prog_doc=''): # pylint: disable=too-many-branches,too-many-statements,too-many-locals
     """Evaluates and responds to passed in command line arguments"""
     logger = None
 
@@ -151,6 +255,56 @@ USAGE
                                 "If not specified in the defaults file, use -o"
                                 " to specify the file system location where "
                                 "the output files will be written."))
+        parser.add_argument("--profile", dest="profile", action='store_true',
+                            help=(
+                                "If specified, the run is profiled by "
+                                "pipeline stage.  Stage timings and the top "
+                                "allocation sites are written to -profile.txt"
+                                ", stack samples for flamegraphs to "
+                                "-profile.folded, and the allocation snapshot"
+                                " to -profile.tracemalloc next to the log "
+                                "file"))
+        parser.add_argument("--progress", dest="progress_interval",
+                            type=float, default=None,
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "--progress to report the events done, rate,"
+                                " ETA and requests in flight every this many"
+                                " seconds, on the console and in a "
+                                "-status.json file next to the log file "
+                                "[default: 0, no progress reporting]"))
+        parser.add_argument("-s", "--summary", dest="summary",
+                            action='store_true',
+                            help=(
+                                "If specified, aggregate counts and "
+                                "time-to-terminate percentiles are computed "
+                                "while the events are written and saved to "
+                                "-summary.json and -summary.csv files next to "
+                                "the events file"))
+        parser.add_argument("--status", dest="status", action='append',
+                            default=None,
+                            help=(
+                                "Only report events with this status (e.g. "
+                                "ACTIVE, SUSPENDED or TERMINATED).  May be "
+                                "repeated or comma separated."))
+        parser.add_argument("--priority", dest="priority", action='append',
+                            default=None,
+                            help=(
+                                "Only report events with this priority (e.g. "
+                                "LOW, MEDIUM or HIGH).  May be repeated or "
+                                "comma separated."))
+        parser.add_argument("--form", dest="form", action='append',
+                            default=None,
+                            help=(
+                                "Only report events created from the form "
+                                "with this id.  May be repeated or comma "
+                                "separated."))
+        parser.add_argument("--submitter", dest="submitter", action='append',
+                            default=None,
+                            help=(
+                                "Only report events submitted by this user "
+                                "(targetName).  May be repeated or comma "
+                                "separated."))
         parser.add_argument('-p', action=__Password, nargs='?',
                             dest='password', default=None,
                             help=(
@@ -163,6 +317,53 @@ USAGE
                                   "-u to specify the xmatters user id that has"
                                   " permissions to get Event and Notification "
                                   "data."))
+        parser.add_argument("-w", "--workers", dest="max_workers", type=int,
+                            default=None,
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "-w to specify the maximum number of "
+                                "concurrent requests made to each xmatters "
+                                "instance [default: 1]"))
+        parser.add_argument("--auth", dest="auth_mode", default=None,
+                            choices=['basic', 'token'],
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "--auth to choose how requests are "
+                                "authenticated: with the user and password on"
+                                " every request, or with an access token that"
+                                " is requested once, cached in a -token.json "
+                                "file next to the events file and refreshed "
+                                "before it expires [default: basic]"))
+        parser.add_argument("--client-id", dest="client_id", default=None,
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "--client-id to specify the client id of the "
+                                "xmatters instance, needed for --auth token"))
+        parser.add_argument("--engine", dest="engine", default=None,
+                            choices=['threads', 'asyncio'],
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "--engine to choose how requests are made: "
+                                "a pool of -w threads, or up to -w concurrent"
+                                " requests on an asyncio event loop, which "
+                                "requires aiohttp [default: threads]"))
+        parser.add_argument("--decode-workers", dest="decode_workers",
+                            type=int, default=None,
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "--decode-workers to decode and extract the "
+                                "event details in this many worker processes,"
+                                " for runs where a single core is the "
+                                "bottleneck [default: 0, decode in-process]"))
+        parser.add_argument("--max-rss", dest="max_rss", type=int,
+                            default=None,
+                            help=(
+                                "If not specified in the defaults file, use "
+                                "--max-rss to specify a memory budget in MB."
+                                "  Fetching is paused, until the events "
+                                "already retrieved are written, whenever the "
+                                "budget is nearly used [default: 0, no "
+                                "budget]"))
         parser.add_argument("-x", "--xmodurl", dest="xmod_url",
                             default=None,
                             help=("If not specified in the defaults file, use "
@@ -199,6 +400,82 @@ USAGE
                          "format: yyyy-MM-dd'T'HH:mm:ssZ (e.g. 2017-01-26T"
                          "10:45:48.011)"))
         all_parser.set_defaults(func=process_all)
+        plan_parser = subparsers.add_parser(
+            'plan', description=("Estimates the cost of reporting on the "
+                                 "events in the specified range"),
+            help=("Use this command in order to learn the number of events, "
+                  "API calls, duration and output size of a report over the "
+                  "specified date range, with a suggested worker count and "
+                  "shard windows, written as JSON to the console or to a "
+                  "file."))
+        plan_parser.add_argument(
+            'start', help=("Specify the event range start date/time in ISO "
+                           "8601 format: yyyy-MM-dd'T'HH:mm:ssZ (e.g. 2017-"
+                           "01-25T10:45:48.011)"))
+        plan_parser.add_argument(
+            'end', help=("Specify the event range end date/time in ISO 8601 "
+                         "format: yyyy-MM-dd'T'HH:mm:ssZ (e.g. 2017-01-26T"
+                         "10:45:48.011)"))
+        plan_parser.add_argument(
+            '--output', dest='plan_filename', default=None,
+            help=("Specify a file to write the plan to, rather than the "
+                  "console.  Without it, the console log is written to "
+                  "stderr, so it is not mixed with the plan"))
+        plan_parser.set_defaults(func=process_plan)
+        for range_parser in [event_parser, all_parser]:
+            range_parser.add_argument(
+                '--sort', dest='sort_output', action='store_true',
+                help=("If specified, the events file is sorted by created "
+                      "date and event id, and duplicate events are removed, "
+                      "once all events have been written"))
+            range_parser.add_argument(
+                '--delta', dest='delta', action='store_true',
+                help=("If specified, only the events that are new or have "
+                      "changed since the previous delta run are written.  A "
+                      "digest index of the events reported is kept in a "
+                      "-digest.csv file next to the events files"))
+            range_parser.add_argument(
+                '--since-report', dest='since_report', default=None,
+                help=("Like --delta, but only writes the events that are new"
+                      " or have changed since the specified events file or "
+                      "digest index.  Only for a single instance"))
+            range_parser.add_argument(
+                '--tombstones', dest='tombstones', action='store_true',
+                help=("If specified in delta mode, the events of the previous"
+                      " report that were created within the range but are no"
+                      " longer reported are listed in a -tombstones.csv file "
+                      "next to the events file"))
+            range_parser.add_argument(
+                '--plan', dest='plan', action='store_true',
+                help=("If specified, the range is planned first, as by the "
+                      "plan command, and each instance uses the suggested "
+                      "worker count"))
+        for range_parser in [event_parser, all_parser, plan_parser]:
+            range_parser.add_argument(
+                '--windows', dest='windows', type=int, default=24,
+                help=("Specify the number of sub-windows the range is "
+                      "measured in when planning [default: %(default)s]"))
+            range_parser.add_argument(
+                '--target-minutes', dest='target_minutes', type=float,
+                default=60,
+                help=("Specify the desired duration of a run, or of each "
+                      "suggested shard, when planning [default: "
+                      "%(default)s]"))
+        merge_parser = subparsers.add_parser(
+            'merge', description=("Merges event files into a single file "
+                                  "sorted by created date and event id"),
+            help=("Use this command in order to combine one or more event "
+                  "files into a single file, in chronological order, without "
+                  "duplicate events."))
+        merge_parser.add_argument(
+            'output', help="Specify the name of the merged event file")
+        merge_parser.add_argument(
+            'inputs', nargs='+', help="Specify the event files to merge")
+        merge_parser.add_argument(
+            '--run-size', dest='run_size', type=int, default=100000,
+            help=("Specify the maximum number of rows held in memory while "
+                  "sorting [default: %(default)s]"))
+        merge_parser.set_defaults(func=process_merge)
 
         # Process arguments
         args = parser.parse_args()
@@ -216,16 +493,47 @@ USAGE
             config.out_directory = args.out_directory
         if args.noisy > 0:
             config.noisy = args.noisy
+        if args.summary:
+            config.summary = args.summary
+        if args.profile or config.PROFILE:
+            config.profile = True
+        for filter_name in event_filter.FILTER_NAMES:
+            values = getattr(args, filter_name)
+            if values:
+                config.event_filters[filter_name] = [
+                    v.strip() for value in values for v in value.split(',')
+                    if v.strip()]
         if args.password:
             password = args.password
         if args.user:
             user = args.user
+        if args.max_workers:
+            config.max_workers = args.max_workers
+        if args.engine:
+            config.engine = args.engine
+        if args.auth_mode:
+            config.auth_mode = args.auth_mode
+        if args.client_id:
+            config.client_id = args.client_id
+        if args.decode_workers:
+            config.decode_workers = args.decode_workers
+        if args.max_rss:
+            config.max_rss = args.max_rss
+        if args.progress_interval:
+            config.progress_interval = args.progress_interval
         if args.verbose > 0:
             config.verbosity = args.verbose
         if args.xmod_url:
             config.xmod_url = args.xmod_url
-        config.event_range_start = args.start
-        config.event_range_end = args.end
+        if getattr(args, 'sort_output', False):
+            config.sort_output = True
+        config.since_report = getattr(args, 'since_report', None)
+        if getattr(args, 'delta', False) or config.since_report:
+            config.delta = True
+        if getattr(args, 'tombstones', False):
+            config.tombstones = True
+        config.event_range_start = getattr(args, 'start', None)
+        config.event_range_end = getattr(args, 'end', None)
 
         # Try to read in the defaults from defaults.json
         try:
@@ -253,16 +561,43 @@ USAGE
             config.out_directory = cfg['outDirectory']
         if config.xmod_url is None and 'xmodURL' in cfg:
             config.xmod_url = cfg['xmodURL']
+        if not config.summary and 'summary' in cfg:
+            config.summary = bool(cfg['summary'])
+        if 'filters' in cfg:
+            try:
+                event_filter.EventFilter(cfg['filters'])
+            except (ValueError, AttributeError, TypeError) as exc:
+                raise(_CLIError(config.ERR_CLI_INVALID_FILTER_MSG % exc,
+                                config.ERR_CLI_INVALID_FILTER_CODE))
+            for filter_name, values in cfg['filters'].items():
+                if filter_name not in config.event_filters:
+                    config.event_filters[filter_name] = (
+                        values if isinstance(values, list) else [values])
+        if not args.engine and cfg.get('engine') in ['threads', 'asyncio']:
+            config.engine = cfg['engine']
+        if not args.auth_mode and cfg.get('auth') in ['basic', 'token']:
+            config.auth_mode = cfg['auth']
+        if config.client_id is None and 'clientId' in cfg:
+            config.client_id = cfg['clientId']
+        if config.decode_workers == 0 and 'decodeWorkers' in cfg:
+            config.decode_workers = int(cfg['decodeWorkers'])
+        if config.max_rss == 0 and 'maxRSS' in cfg:
+            config.max_rss = int(cfg['maxRSS'])
+        if config.progress_interval == 0 and 'progressInterval' in cfg:
+            config.progress_interval = float(cfg['progressInterval'])
+        if config.max_workers == 0 and 'maxWorkers' in cfg:
+            config.max_workers = int(cfg['maxWorkers'])
         if config.verbosity == 0 and 'verbosity' in cfg:
             if cfg['verbosity'] in [1, 2, 3]:
                 config.verbosity = cfg['verbosity']
 
         # Fix file names
         time_str = time.strftime("-%Y%m%d-%H%M")
+        events_base = None
         if config.events_filename:
-            config.events_filename = (
-                config.out_directory + config.dir_sep +
-                config.events_filename + time_str + '.csv')
+            events_base = (
+                config.out_directory + config.dir_sep + config.events_filename)
+            config.events_filename = events_base + time_str + '.csv'
         if config.log_filename:
             config.log_filename = (
                 config.out_directory + config.dir_sep +
@@ -272,28 +607,27 @@ USAGE
                 config.out_directory + config.dir_sep +
                 config.notifs_filename + time_str + '.csv')
 
+        # A plan written to stdout must not be mixed with the console log
+        if args.command_name == 'plan' and not args.plan_filename:
+            config.console_stream = 'ext://sys.stderr'
+
         # Initialize logging
         logger = ear_logger.get_logger()
         logger.info("event_audit_report Started.")
         logger.info("After parser.parse_args(), command_name=%s",
                     args.command_name)
 
+        # Merging works on existing files so needs no instance or range
+        if args.command_name == 'merge':
+            return args
+
         # Final verification of arguments
-        if config.xmod_url:
-            logger.info("xmatters Instance URL is: %s", config.xmod_url)
-        else:
-            raise(_CLIError(config.ERR_CLI_MISSING_XMOD_URL_MSG,
-                            config.ERR_CLI_MISSING_XMOD_URL_CODE))
-        if user:
-            logger.info("User is: %s", user)
-        else:
-            raise(_CLIError(config.ERR_CLI_MISSING_USER_MSG,
-                            config.ERR_CLI_MISSING_USER_CODE))
-        if password:
-            logger.info("Password was provided.")
+        if 'instances' in cfg and not args.xmod_url:
+            instance_cfgs = cfg['instances']
         else:
-            raise(_CLIError(config.ERR_CLI_MISSING_PASSWORD_MSG,
-                            config.ERR_CLI_MISSING_PASSWORD_CODE))
+            instance_cfgs = [{'xmodURL': config.xmod_url}]
+        for instance_cfg in instance_cfgs:
+            __verify_instance(instance_cfg, user, password, logger)
         if config.out_directory:
             logger.info("Output directory is: %s", config.out_directory)
         else:
@@ -323,8 +657,26 @@ USAGE
                 config.ERR_CLI_INVALID_START_DATE_MSG%(config.event_range_end),
                 config.ERR_CLI_INVALID_START_DATE_CODE))
 
-        # Setup the basic auth object for subsequent REST calls
-        config.basic_auth = auth.HTTPBasicAuth(user, password)
+        # Setup the instances, with the basic auth object for subsequent REST
+        # calls to each
+        config.instances = []
+        for instance_cfg in instance_cfgs:
+            instance = __create_instance(
+                instance_cfg, user, password, events_base, time_str,
+                len(instance_cfgs) > 1)
+            if instance.name in [i.name for i in config.instances]:
+                raise(_CLIError(
+                    config.ERR_CLI_DUPLICATE_INSTANCE_MSG % instance.name,
+                    config.ERR_CLI_DUPLICATE_INSTANCE_CODE))
+            logger.info("Instance %s: %d workers, events output filename is: "
+                        "%s", instance.name, instance.max_workers,
+                        instance.events_filename)
+            config.instances.append(instance)
+        if config.since_report and len(config.instances) > 1:
+            raise(_CLIError(config.ERR_CLI_SINCE_REPORT_MULTIPLE_MSG,
+                            config.ERR_CLI_SINCE_REPORT_MULTIPLE_CODE))
+        config.xmod_url = config.instances[0].xmod_url
+        config.basic_auth = config.instances[0].auth
 
         return args
 
@@ -341,7 +693,7 @@ USAGE
         sys.stderr.write(msg)
         indent = len(config.program_name) * " "
         sys.stderr.write(indent + "  for help use --help")
-        sys.exit(cli_except.rc)
+        sys.exit(cli_except.result_code)
 
     except Exception as exc: # pylint: disable=broad-except
         if config.DEBUG or config.TESTRUN:
@@ -38,8 +38,25 @@ events_file = None
 notifs_file = None
 dir_sep = "/"
 basic_auth = None
+auth_mode = 'basic'
+client_id = None
+instances = []
+max_workers = 0
+engine = 'threads'
+decode_workers = 0
+max_rss = 0
+progress_interval = 0
 verbosity = 0
 noisy = False
+# Stream the console log is written to, stderr when stdout carries output
+console_stream = 'ext://sys.stdout'
+summary = False
+profile = False
+sort_output = False
+delta = False
+since_report = None
+tombstones = False
+event_filters = {}
 
 # Error codes
 ERR_CLI_EXCEPTION = -1
@@ -81,6 +98,27 @@ ERR_REQUEST_NEXT_EXCEPCTION_CODE = -12
 ERR_INITIAL_REQUEST_FAILED_CODE = -13
 ERR_INITIAL_REQUEST_FAILED_MSG = ("Error %d on initial request to %s.\nPlease "
                                   "verify instance address, user, and password")
+ERR_CLI_INVALID_FILTER_CODE = -14
+ERR_CLI_INVALID_FILTER_MSG = "Invalid filters in the defaults file: %s"
+ERR_CLI_DUPLICATE_INSTANCE_CODE = -15
+ERR_CLI_DUPLICATE_INSTANCE_MSG = ("Instance name '%s' is used more than once in"
+                                  " the defaults file")
+ERR_MERGE_FAILED_CODE = -16
+ERR_MERGE_FAILED_MSG = "Unable to merge the event files: %s"
+ERR_ASYNC_UNAVAILABLE_CODE = -17
+ERR_ASYNC_UNAVAILABLE_MSG = ("The asyncio engine requires the aiohttp package."
+                             "  Install it with: pip install aiohttp")
+ERR_CLI_SINCE_REPORT_MULTIPLE_CODE = -18
+ERR_CLI_SINCE_REPORT_MULTIPLE_MSG = ("--since-report can only be used with a "
+                                     "single instance.  Use --delta to keep a"
+                                     " digest index for each instance")
+ERR_CLI_MISSING_CLIENT_ID_CODE = -19
+ERR_CLI_MISSING_CLIENT_ID_MSG = ("Token authentication requires the client id"
+                                 " of instance %s.  Specify it with "
+                                 "--client-id or clientId in the defaults")
+ERR_MAX_RSS_TOO_LOW_CODE = -20
+ERR_MAX_RSS_TOO_LOW_MSG = ("--max-rss of %d MB is too low, as the process "
+                           "already uses %d MB.  Raise it, e.g. to %d MB")
 
 def main():
     """ To pass conventions, in case we need to execute main """
@@ -32,6 +32,8 @@ def get_logger() -> Logger:
             Source is the log_filename attribute from the config object.
         noisy (int): Determines whether or not the log statements are echoed
             to the console.  Source is the noisy attribute from config object.
+        console_stream (str): Stream the console handler writes to.  Source
+            is the console_stream attribute from the config object.
 
     Args:
 
@@ -60,7 +62,7 @@ def get_logger() -> Logger:
                     'level': cLevel,
                     'class': 'logging.StreamHandler',
                     'formatter': 'default',
-                    'stream': 'ext://sys.stdout'
+                    'stream': config.console_stream
                 },
                 'file': {
                     'level': level,
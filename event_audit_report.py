@@ -26,6 +26,8 @@ import sys
 
 import config
 import cli
+import ear_logger
+import profiler
 
 __all__ = []
 __version__ = config.VERSION
@@ -36,7 +38,16 @@ def main(argv=None):
     """ Begins the Event Audit Report process """
 
     args = cli.process_command_line(argv, __doc__)
-    args.func(args)
+    if not config.profile:
+        args.func(args)
+        return
+    profiler.start(config.log_filename[:-len('.log')])
+    profiler.profile_logger(ear_logger.get_logger())
+    try:
+        args.func(args)
+    finally:
+        for filename in profiler.stop():
+            ear_logger.get_logger().info("Profile written to %s", filename)
 
 if __name__ == "__main__":
     if config.DEBUG:
@@ -45,15 +56,4 @@ if __name__ == "__main__":
     if config.TESTRUN:
         import doctest
         doctest.testmod()
-    if config.PROFILE:
-        import cProfile
-        import pstats
-        profile_filename = 'EventAuditReport_profile.txt'
-        cProfile.run('main()', profile_filename)
-        statsfile = open("profile_stats.txt", "wb")
-        p = pstats.Stats(profile_filename, stream=statsfile)
-        stats = p.strip_dirs().sort_stats('cumulative')
-        stats.print_stats()
-        statsfile.close()
-        sys.exit(0)
     sys.exit(main())
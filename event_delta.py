@@ -0,0 +1,180 @@
+"""Limits the events file to the events that changed since the last report
+
+In delta mode, a digest index is kept from one run to the next.  It holds,
+for each event written, the event's created date and a short hash of its
+row.  A run only writes the rows that are new, or whose hash differs from
+the one in the index, and can list in a tombstones file the events of the
+index that were created within the range but were not reported this time.
+The index is then rewritten with the events of this run, keeping the
+entries that were created outside the range.
+
+The index is a CSV file with the columns id, created and digest.  An events
+file written by an earlier run can be used in its place, in which case the
+digests are computed from its rows.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import csv
+import hashlib
+import os
+
+import event_row
+
+# Bytes of the row hash kept in the index
+_DIGEST_SIZE = 8
+
+# Length of the date and time part of a created date, without the time zone
+_TIMESTAMP_LENGTH = len('2017-01-25T10:45:48.011')
+
+_INDEX_COLUMNS = ('id', 'created', 'digest')
+_TOMBSTONE_COLUMNS = ('id', 'created')
+
+def row_digest(row) -> bytes:
+    """Returns the hash of a row, as written to the events file
+
+    Args:
+        row (list): The values of the row, e.g. an EventRow
+    """
+    return hashlib.blake2b(event_row.format_rows([row]).encode('utf-8'),
+                           digest_size=_DIGEST_SIZE).digest()
+
+def load_index(filename: str) -> dict:
+    """Reads a digest index, or builds one from an events file
+
+    Args:
+        filename (str): Digest index or events file written by an earlier run
+
+    Returns:
+        dict: (created, digest) keyed by event id, empty if filename does
+            not exist
+    """
+    index = {}
+    if not os.path.exists(filename):
+        return index
+    csv.field_size_limit(event_row.FIELD_SIZE_LIMIT)
+    with open(filename, newline='') as in_file:
+        reader = csv.reader(in_file)
+        header = next(reader, None)
+        if header is None:
+            return index
+        if tuple(header) == _INDEX_COLUMNS:
+            for event_id, created, digest in reader:
+                index[event_id] = (created, bytes.fromhex(digest))
+        elif 'eventId' in header and 'created' in header:
+            event_id = header.index('eventId')
+            created = header.index('created')
+            for row in reader:
+                if row and row[event_id] != 'N/A':
+                    index[row[event_id]] = (row[created], row_digest(row))
+        else:
+            raise ValueError("%s is neither a digest index nor an events file"
+                             % filename)
+    return index
+
+def _write_rows(filename: str, rows):
+    """Replaces filename with the rows, in the events file format"""
+    updating = filename + '.updating'
+    with open(updating, 'w') as out_file:
+        out_file.write(event_row.format_rows(rows))
+    os.replace(updating, filename)
+
+class DeltaIndex(object):
+    """Decides which events to write, against the index of an earlier run
+
+    Args:
+        baseline (dict): Index of the earlier run, from load_index()
+        range_start (str): Start of the range being reported
+        range_end (str): End of the range being reported
+    """
+    def __init__(self, baseline: dict, range_start: str, range_end: str):
+        self._baseline = baseline
+        self._current = {}
+        self._range_start = range_start[:_TIMESTAMP_LENGTH]
+        self._range_end = range_end[:_TIMESTAMP_LENGTH]
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+
+    def _in_range(self, created: str) -> bool:
+        """Returns True if created is within the range being reported
+
+        Events whose details were not found have no created date.  They are
+        treated as within every range, so they are dropped from the index,
+        and tombstoned, once a run no longer reports them.
+        """
+        if created == 'N/A':
+            return True
+        return (self._range_start <= created[:_TIMESTAMP_LENGTH]
+                <= self._range_end)
+
+    def update(self, event_id: str, row: event_row.EventRow) -> bool:
+        """Records an event of this run
+
+        Args:
+            event_id (str): Id of the event in the events list, used when the
+                row has no eventId
+            row (EventRow): The event's row
+
+        Returns:
+            bool: True if the row is new or has changed, so must be written
+        """
+        key = str(row['eventId'])
+        if key == 'N/A':
+            key = event_id
+        digest = row_digest(row)
+        self._current[key] = (str(row['created']), digest)
+        previous = self._baseline.get(key)
+        if previous is None:
+            self.new += 1
+            return True
+        if previous[1] != digest:
+            self.changed += 1
+            return True
+        self.unchanged += 1
+        return False
+
+    def tombstones(self) -> list:
+        """Returns (id, created) of the earlier run's events that are gone
+
+        These are the events of the baseline that were created within the
+        range but were not recorded by update().
+        """
+        return sorted(
+            (key, created) for key, (created, _) in self._baseline.items()
+            if key not in self._current and self._in_range(created))
+
+    def write_tombstones(self, filename: str) -> int:
+        """Writes the tombstones file
+
+        Returns:
+            int: number of tombstones written
+        """
+        tombstones = self.tombstones()
+        _write_rows(filename, [_TOMBSTONE_COLUMNS] + tombstones)
+        return len(tombstones)
+
+    def write(self, filename: str):
+        """Replaces the digest index with the events of this run
+
+        Entries of the earlier run that were created outside the range are
+        kept, so the index covers every range reported so far.
+        """
+        index = {
+            key: entry for key, entry in self._baseline.items()
+            if not self._in_range(entry[0])
+        }
+        index.update(self._current)
+        _write_rows(filename, [_INDEX_COLUMNS] + [
+            (key, created, digest.hex())
+            for key, (created, digest) in sorted(index.items())
+        ])
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compiles the event filter options into query parameters and predicates
+
+Filters on status and priority are pushed down to the events list request
+as query parameters.  Every filter is also compiled, once, into a predicate
+that is evaluated against each list record before its details are
+requested, so that events that can be rejected from the list record alone
+never cost a detail request.  When a list record does not carry a filtered
+property, the decision is deferred until the event details have been
+retrieved.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+# Filter name -> (event property path, list query parameter or None)
+_FILTERS = {
+    'status': ('status', 'status'),
+    'priority': ('priority', 'priority'),
+    'form': ('form.id', None),
+    'submitter': ('submitter.targetName', None)
+}
+
+# Names of the filters, as used by the command line options
+FILTER_NAMES = tuple(_FILTERS)
+
+# Filters whose values are enumerations and compared case insensitively
+_UPPER_CASE_FILTERS = ['status', 'priority']
+
+_MISSING = object()
+
+def _lookup(record: dict, path: str):
+    """Returns the value at path in record, or _MISSING if not present
+
+    Event rows hold dotted names such as 'form.id' as flat keys, whereas the
+    list records hold them as nested objects, so both forms are tried.
+
+    Args:
+        record (dict): A list record or an event row
+        path (str): Property name, with dots separating nested names
+    """
+    if path in record:
+        return record[path]
+    value = record
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+class EventFilter(object):
+    """Holds the query parameters and predicates for a set of filters
+
+    Args:
+        filters (dict): Filter name to list of accepted values
+    """
+    def __init__(self, filters: dict):
+        self._params = {}
+        self._tests = []
+        for name, values in sorted((filters or {}).items()):
+            if name not in _FILTERS:
+                raise ValueError("Unknown event filter '%s'.  Expecting one "
+                                 "of: %s" % (name, ', '.join(FILTER_NAMES)))
+            values = [str(v) for v in values if str(v)]
+            if not values:
+                continue
+            upper = name in _UPPER_CASE_FILTERS
+            if upper:
+                values = [v.upper() for v in values]
+            path, param = _FILTERS[name]
+            if param:
+                self._params[param] = ','.join(values)
+            self._tests.append((path, frozenset(values), upper))
+
+    def __bool__(self):
+        return bool(self._tests)
+
+    def query_params(self) -> dict:
+        """Returns the filters that can be pushed down to the list request"""
+        return dict(self._params)
+
+    def matches(self, record: dict):
+        """Evaluates the filters against a list record or event row
+
+        Args:
+            record (dict): A list record or an event row
+
+        Returns:
+            bool: True if every filter matches, False if any does not, or
+                None if a filtered property is not present in record
+        """
+        result = True
+        for path, accepted, upper in self._tests:
+            value = _lookup(record, path)
+            if value is _MISSING or value == 'N/A':
+                result = None
+                continue
+            value = str(value).upper() if upper else str(value)
+            if value not in accepted:
+                return False
+        return result
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
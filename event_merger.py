@@ -0,0 +1,252 @@
+"""Sorts, de-duplicates and combines event report files
+
+The event files written by get_events can hold the same event more than
+once, when events created during paging shift the nextRecordsUrl chain, and
+rows from concurrent requests or several reports are not in chronological
+order.  merge_files() performs a bounded-memory external merge sort of one
+or more event files on (created, eventId), keeping a single row per event.
+Both the rows held in memory and the files open at once are bounded.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import csv
+import heapq
+import os
+import tempfile
+
+import ear_logger
+import event_row
+
+# Largest number of run files read at once while merging
+_FAN_IN = 64
+
+_CREATED_COLUMN = 'created'
+_EVENT_ID_COLUMN = 'eventId'
+
+# eventId of the rows written for events whose details were not found
+_MISSING_EVENT_IDS = ('', 'N/A')
+
+def _open_writer(filename: str):
+    """Opens filename for writing rows in the events file format
+
+    Returns:
+        tuple: (file, csv.writer)
+    """
+    out_file = open(filename, 'w', newline='')
+    return out_file, csv.writer(out_file, quoting=csv.QUOTE_ALL,
+                                lineterminator='\n')
+
+def _read_rows(filename: str, header: list, has_header: bool = True):
+    """Yields the data rows of an events file or run file
+
+    Args:
+        filename (str): Events file to read
+        header (list): Expected header row
+        has_header (bool): False for a run file, which has no header row
+
+    Yields:
+        list: row
+
+    Raises:
+        ValueError: if the header differs, or a row does not have as many
+            columns as the header
+    """
+    with open(filename, newline='') as in_file:
+        reader = csv.reader(in_file)
+        if has_header and next(reader, None) != header:
+            raise ValueError(
+                "%s does not have the same columns as the other event "
+                "files" % filename)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header):
+                raise ValueError(
+                    "%s line %d has %d columns rather than %d" % (
+                        filename, reader.line_num, len(row), len(header)))
+            yield row
+
+def _read_header(filename: str) -> list:
+    """Returns the header row of an events file"""
+    with open(filename, newline='') as in_file:
+        return next(csv.reader(in_file), None)
+
+def _sort_key(created: int, event_id: int):
+    """Returns a function that extracts the sort key from a row
+
+    Event ids are compared by length first so that numeric ids sort in
+    numeric rather than lexical order.
+
+    Args:
+        created (int): Index of the created column
+        event_id (int): Index of the eventId column
+    """
+    def key(row):
+        return (row[created], len(row[event_id]), row[event_id])
+    return key
+
+def _write_run(rows: list, key, tmp_dir: str) -> str:
+    """Sorts rows and writes them to a new temporary run file
+
+    Returns:
+        str: name of the run file
+    """
+    rows.sort(key=key)
+    handle, run_filename = tempfile.mkstemp(suffix='.csv', dir=tmp_dir)
+    os.close(handle)
+    run_file, writer = _open_writer(run_filename)
+    with run_file:
+        writer.writerows(rows)
+    return run_filename
+
+def _split_runs(in_filenames: list, header: list, key, run_size: int,
+                tmp_dir: str, run_filenames: list):
+    """Splits the event files into sorted runs of at most run_size rows
+
+    Args:
+        run_filenames (list): The name of each run file written is appended,
+            in the order the rows were read
+    """
+    rows = []
+    for filename in in_filenames:
+        ear_logger.get_logger().info("Reading events from %s", filename)
+        for row in _read_rows(filename, header):
+            rows.append(row)
+            if len(rows) >= run_size:
+                run_filenames.append(_write_run(rows, key, tmp_dir))
+                rows = []
+    if rows or not run_filenames:
+        run_filenames.append(_write_run(rows, key, tmp_dir))
+
+def _merged_rows(run_filenames: list, header: list, key):
+    """Yields the rows of the runs in sorted order
+
+    Rows with equal keys are yielded in the order of the runs, so the row
+    that was read last comes last.
+    """
+    return heapq.merge(*[_read_rows(f, header, False) for f in run_filenames],
+                       key=key)
+
+def _reduce_runs(run_filenames: list, header: list, key, tmp_dir: str,
+                 fan_in: int):
+    """Merges consecutive runs until at most fan_in are left
+
+    Each pass merges groups of up to fan_in runs into a single run, so no
+    more than fan_in files are open at once.  Keeping the groups in order
+    preserves the order of rows with equal keys.
+
+    Args:
+        run_filenames (list): Run files, replaced in place by the merged
+            runs, so that it always lists the files to clean up
+    """
+    while len(run_filenames) > fan_in:
+        ear_logger.get_logger().info("Merging %d sorted runs in groups of %d",
+                                     len(run_filenames), fan_in)
+        remaining = len(run_filenames)
+        while remaining:
+            group = run_filenames[:min(fan_in, remaining)]
+            handle, merged_filename = tempfile.mkstemp(suffix='.csv',
+                                                       dir=tmp_dir)
+            os.close(handle)
+            run_filenames.append(merged_filename)
+            run_file, writer = _open_writer(merged_filename)
+            with run_file:
+                writer.writerows(_merged_rows(group, header, key))
+            for run_filename in group:
+                os.remove(run_filename)
+            del run_filenames[:len(group)]
+            remaining -= len(group)
+
+def _write_merged(run_filenames: list, header: list, key, event_id: int,
+                  out_filename: str) -> tuple:
+    """Writes the merged runs to out_filename, keeping one row per event
+
+    Returns:
+        tuple: (rows written, duplicate rows dropped)
+    """
+    written = 0
+    dropped = 0
+    out_file, writer = _open_writer(out_filename)
+    with out_file:
+        writer.writerow(header)
+        previous = None
+        for row in _merged_rows(run_filenames, header, key):
+            if previous is not None and key(previous) == key(row) \
+                    and row[event_id] not in _MISSING_EVENT_IDS:
+                dropped += 1
+            elif previous is not None:
+                writer.writerow(previous)
+                written += 1
+            previous = row
+        if previous is not None:
+            writer.writerow(previous)
+            written += 1
+    return written, dropped
+
+def merge_files(in_filenames: list, out_filename: str, run_size: int = 100000,
+                tmp_dir: str = None, fan_in: int = _FAN_IN) -> tuple:
+    """Merges event files into a single sorted file without duplicate events
+
+    Rows are read in runs of at most run_size rows, each of which is sorted
+    and spilled to a temporary file.  The runs are then merged, at most
+    fan_in at a time, so memory use is bounded by run_size and the files
+    open at once by fan_in, rather than by the size of the inputs.  When an
+    event appears more than once, the row that was read last is kept, as it
+    holds the most recently retrieved state.  Rows without an eventId,
+    written for events whose details were not found, are all kept.
+    out_filename may be one of the input files, which is only replaced once
+    the merge has succeeded.
+
+    Args:
+        in_filenames (list): Names of the event files to merge
+        out_filename (str): Name of the merged event file to write
+        run_size (int): Maximum number of rows held in memory
+        tmp_dir (str): Directory for the temporary run files, defaults to
+            the directory of out_filename
+        fan_in (int): Maximum number of run files read at once
+
+    Returns:
+        tuple: (rows written, duplicate rows dropped)
+    """
+    logger = ear_logger.get_logger()
+    csv.field_size_limit(event_row.FIELD_SIZE_LIMIT)
+    if not in_filenames:
+        raise ValueError("No event files to merge")
+    header = _read_header(in_filenames[0])
+    if not header or _CREATED_COLUMN not in header \
+            or _EVENT_ID_COLUMN not in header:
+        raise ValueError("%s is not an event file" % in_filenames[0])
+    event_id = header.index(_EVENT_ID_COLUMN)
+    key = _sort_key(header.index(_CREATED_COLUMN), event_id)
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(out_filename))
+
+    run_filenames = []
+    merged_filename = out_filename + '.merging'
+    try:
+        _split_runs(in_filenames, header, key, run_size, tmp_dir,
+                    run_filenames)
+        _reduce_runs(run_filenames, header, key, tmp_dir, max(2, fan_in))
+        logger.info("Merging %d sorted runs into %s", len(run_filenames),
+                    out_filename)
+        written, dropped = _write_merged(run_filenames, header, key,
+                                         event_id, merged_filename)
+        os.replace(merged_filename, out_filename)
+    finally:
+        for run_filename in run_filenames + [merged_filename]:
+            if os.path.exists(run_filename):
+                os.remove(run_filename)
+
+    logger.info("Wrote %d events to %s, dropped %d duplicates", written,
+                out_filename, dropped)
+    return written, dropped
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -6,43 +6,127 @@
 """
 
 import sys
+import json
+import time
 import pprint
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode
 from io import TextIOBase
+from typing import Union
 
 import requests
 
 import config
 import ear_logger
+import event_delta
+import event_filter
+import event_merger
+import event_row
+import event_summary
+import memory_budget
+import profiler
+import progress
+import run_planner
+import token_auth
+from xm_instance import Instance
 
 _logger = None
+_decode_pool = None
+_memory_budget = None
+_progress = None
 
-_event_prop_list = [
-    'eventId', 'created', 'terminated', 'submitter.targetName', 'status',
-    'priority', 'incident', 'recipients.total', 'recipients.count',
-    'recipients:recipientType|targetName|status', 'responseOptions.total',
-    'responseOptions.count', 'responseOptions:number|text|action|contribution',
-    'expirationInMinutes', 'id', 'form.id'
-]
+# Number of event detail responses sent to a decode worker at a time
+_DECODE_BATCH_SIZE = 256
 
-def _log_and_exit(url, response, event_file):
+
+class _RequestError(Exception):
+    """Raised when a request to an instance fails and the run must stop."""
+    def __init__(self, msg, rc):
+        super(_RequestError, self).__init__(msg)
+        self.result_code = rc
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+def _log_and_raise(url: str, status_code: int, content: bytes):
     """Captures and logs errors
 
-    Logs the error caused by attempting to call url and then exits.
+    Logs the error caused by attempting to call url and then raises a
+    _RequestError so that the instance being processed is stopped.
 
     Args:
         url (str): The location being requested that caused the error
-        response (object): JSON object that holds the error response
-        event_file (file): Open file object to close
+        status_code (int): HTTP status of the error response
+        content (bytes): JSON document that holds the error response
     """
-    body = response.json()
-    _logger.error(config.ERR_INITIAL_REQUEST_FAILED_MSG,
-                  response.status_code, url)
+    try:
+        body = json.loads(content)
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    _logger.error(config.ERR_INITIAL_REQUEST_FAILED_MSG, status_code, url)
     _logger.error("Response - code: %s, reason: %s, message: %s",
                   str(body['code']) if 'code' in body else "none",
                   str(body['reason']) if 'reason' in body else "none",
                   str(body['message']) if 'message' in body else "none")
-    event_file.close()
-    sys.exit(config.ERR_INITIAL_REQUEST_FAILED_CODE)
+    raise _RequestError(config.ERR_INITIAL_REQUEST_FAILED_MSG % (
+        status_code, url), config.ERR_INITIAL_REQUEST_FAILED_CODE)
+
+def _get(instance: Instance, url: str, rc: int) -> requests.Response:
+    """GETs url from instance, converting request exceptions to _RequestError
+
+    Args:
+        instance (Instance): The instance to send the request to
+        url (str): Resource path relative to the instance base URL
+        rc (int): Result code to report if the request raises an exception
+
+    Returns:
+        Response: response
+    """
+    if _progress is not None:
+        _progress.request_started(instance.name)
+    try:
+        response = instance.get(url)
+        if response.status_code == 401 and _token_rejected(
+                instance, response.request.headers):
+            response = instance.get(url)
+        return response
+    except requests.exceptions.RequestException as e:
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG,
+                      instance.xmod_url + url, repr(e))
+        raise _RequestError(config.ERR_REQUEST_EXCEPTION_MSG % (
+            instance.xmod_url + url, repr(e)), rc)
+    finally:
+        if _progress is not None:
+            _progress.request_finished(instance.name)
+
+def _token_rejected(instance: Instance, headers) -> bool:
+    """Drops the access token sent with a request that got a 401 response
+
+    An access token can be revoked before it expires, so the request is
+    retried once with a new token.
+
+    Args:
+        instance (Instance): The instance the request was sent to
+        headers (dict): Headers of the rejected request
+
+    Returns:
+        bool: True if the instance uses token authentication, so the
+            request should be retried
+    """
+    if not isinstance(instance.auth, token_auth.TokenAuth):
+        return False
+    _logger.warning("[%s] Access token was rejected, requesting a new one.",
+                    instance.name)
+    instance.auth.invalidate(
+        headers.get('Authorization', '')[len('Bearer '):])
+    return True
 
 def _create_event_out_file(event_filename: str) -> TextIOBase:
     """Creates and opens event results file
@@ -56,186 +140,934 @@ def _create_event_out_file(event_filename: str) -> TextIOBase:
     outFile = open(event_filename, 'w')
     return outFile
 
-def _write_event_header(event_file: TextIOBase):
-    """Writes the event file's header row
+def _extract_event(status_code: int, body: dict) -> event_row.EventRow:
+    """Converts an event details response to the event's row.
+
+    Args:
+        status_code (int): HTTP status of the event details response
+        body (dict): Decoded JSON body of the event details response
+
+    Return:
+        EventRow: event, with "N/A" for each property that is not present
+    """
+    if status_code != 200:
+        return event_row.EventRow(["N/A"] * len(event_row.PROPERTIES))
+
+    values = []
+    for prop_key in event_row.PROPERTIES:
+        value = "N/A"
+        if '.' in prop_key:
+            #dot notation means a reference to a sub-element
+            pk_parts = prop_key.split('.')
+            if pk_parts[0] in body:
+                value = body[pk_parts[0]][pk_parts[1]]
+        elif ':' in prop_key:
+            #colon notation is a reference to a list of sub-elements
+            pk_parts = prop_key.split(':')
+            if pk_parts[0] in body:
+                list_data = body[pk_parts[0]]['data']
+                item_names = pk_parts[1].split('|')
+                #tupples are separated by commas, values by pipe (|)
+                value = ','.join(
+                    [
+                        '|'.join([
+                            str(el[item] if item in el else "")
+                            for item in item_names
+                            ])
+                        for el in list_data
+                    ])
+        elif prop_key in body:
+            value = body[prop_key]
+        values.append(value)
+
+    return event_row.EventRow(values)
+
+def _event_details(instance: Instance, url: str, event_id: str,
+                   status_code: int, content: bytes,
+                   raw: bool = False) -> Union[event_row.EventRow, tuple]:
+    """Converts the response to an event details request to the event.
+
+    Args:
+        instance (Instance): The instance that holds the event
+        url (str): Resource path of the event details
+        event_id (str): The unique identifier for the event object
+        status_code (int): HTTP status of the response
+        content (bytes): Body of the response
+        raw (bool): When true, the response is checked but left for the
+            decode pool to decode
+
+    Return:
+        EventRow: event, or tuple: (status_code, content) when raw is true
+    """
+    if status_code not in [200, 404]:
+        _log_and_raise(instance.xmod_url + url, status_code, content)
+    if _memory_budget is not None:
+        _memory_budget.charge((instance.name, event_id), len(content))
+
+    # Leave the decoding to the decode pool's worker processes
+    if raw:
+        return status_code, content
+
+    # Process the response
+    with profiler.stage('extraction'):
+        body = json.loads(content)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("Event %s - json body: %s", event_id,
+                          pprint.pformat(body))
+        return _extract_event(status_code, body)
+
+def _decode_events(batch: list) -> list:
+    """Decodes and extracts a batch of event details responses.
+
+    Runs in the decode pool's worker processes, so it must not log.
 
     Args:
-        event_file (TextIOBase): Open event file to write headers to
+        batch (list): (status_code, content) for each response
+
+    Returns:
+        list: event for each response in batch
     """
-    event_file.write(','.join(['"' + p + '"' for p in _event_prop_list]))
-    event_file.write('\n')
+    return [
+        _extract_event(status_code, json.loads(content))
+        for status_code, content in batch
+    ]
 
-def _write_event(event_file: TextIOBase, event: dict):
-    """Writes the event to the event file
+class _DecodePipeline(object):
+    """Sends event details responses to the decode pool in batches
 
-    Creates and write a comma delimited row of data based on the contents
-    of event.  If the name of the dictionary element, from _event_prop_list,
-    contains a colon (:), then the data is itself a tuple and the value before
-    the colon is the actual element name that holds the tupple in event.
+    Called in place of on_event by the threads engine, it collects the raw
+    responses into batches for _decode_events and passes the decoded events
+    on to on_event in the order they were received.  The asyncio engine
+    calls put() instead, which awaits the decoded batches so the event loop
+    keeps serving requests meanwhile.  While the memory budget is
+    exhausted, partial batches are decoded straight away, so their payloads
+    are released rather than held until a batch fills.
 
     Args:
-        event_file (TextIOBase): Open event file to write event data to
-        event (dict): Event object to write out
+        pool (ProcessPoolExecutor): The decode pool
+        on_event (callable): Called with (event_id, row_filter, event) for
+            each decoded event
+        max_batches (int): Number of batches queued before waiting for the
+            oldest to be decoded
     """
-    event_file.write(
-        ','.join(
-            [
-                '"' + str(event[p if ':' not in p else p.split(':')[0]]) + '"'
-                for p in _event_prop_list
-            ]
-        ))
-    event_file.write('\n')
+    def __init__(self, pool: ProcessPoolExecutor, on_event, max_batches: int):
+        self._pool = pool
+        self._on_event = on_event
+        self._max_batches = max(1, max_batches)
+        self._batch = []
+        self._pending = deque()
+
+    def __call__(self, event_id: str, row_filter, response: tuple):
+        keep = self._add(event_id, row_filter, response)
+        while len(self._pending) > keep:
+            self._write_next()
+
+    async def put(self, event_id: str, row_filter, response: tuple):
+        """Coroutine equivalent of calling the pipeline"""
+        keep = self._add(event_id, row_filter, response)
+        while len(self._pending) > keep:
+            keys, future = self._pending.popleft()
+            started = time.perf_counter()
+            events = await asyncio.wrap_future(future)
+            profiler.record('extraction', time.perf_counter() - started)
+            self._pass_on(keys, events)
+
+    def _add(self, event_id: str, row_filter, response: tuple) -> int:
+        """Adds a response to the current batch
+
+        Returns:
+            int: number of batches that may stay queued, 0 when every batch
+                must be passed on because the memory budget is exhausted
+        """
+        status_code, content = response
+        self._batch.append((event_id, row_filter, status_code, content))
+        if len(self._batch) >= _DECODE_BATCH_SIZE:
+            self._submit()
+        elif _budget_exhausted():
+            self._submit()
+            return 0
+        return self._max_batches
+
+    def _submit(self):
+        """Queues the current batch for decoding"""
+        batch = self._batch
+        self._batch = []
+        future = self._pool.submit(
+            _decode_events, [(s, c) for _, _, s, c in batch])
+        self._pending.append(([(e, f) for e, f, _, _ in batch], future))
 
-def _get_event_details(event_id: str, event_file: TextIOBase) -> dict:
+    def _pass_on(self, keys: list, events: list):
+        """Passes the decoded events of a batch on to on_event"""
+        for (event_id, row_filter), event in zip(keys, events):
+            self._on_event(event_id, row_filter, event)
+
+    def _write_next(self):
+        """Waits for the oldest batch to be decoded and passes it on"""
+        keys, future = self._pending.popleft()
+        with profiler.stage('extraction'):
+            events = future.result()
+        self._pass_on(keys, events)
+
+    def flush(self):
+        """Decodes and passes on every response received so far
+
+        Blocks, so the asyncio engine only calls it once its event loop has
+        finished.
+        """
+        if self._batch:
+            self._submit()
+        while self._pending:
+            self._write_next()
+
+def _get_event_details(instance: Instance, event_id: str,
+                       include_notifs: bool,
+                       raw: bool = False) -> Union[event_row.EventRow, tuple]:
     """Get the detailed properties for the event defined by event_id.
 
     Retrieves the Event object details from xmatters based on the event_id.
-    The details are converted to a property array that is then returned.
+    The details are converted to an event row that is then returned.
+    Called from the instance's worker threads.
 
     Args:
+        instance (Instance): The instance that holds the event
         event_id (str): The unique identifier for the event object to retrieve
-        event_file (TextIOBase): Open event file to write event data to
+        include_notifs (bool): When true, collect and write out notifications
+        raw (bool): When true, return the undecoded response
 
     Return:
-        dict: event
+        EventRow: event, or tuple: (status_code, content), as returned by
+            _event_details
     """
+    _logger.info("[%s] Processing Event Id: %s, include_notifs: %s",
+                 instance.name, event_id, str(include_notifs))
 
     # Set our resource URI
-    url = config.xmod_url + '/api/xm/1/events/' + event_id
+    url = '/api/xm/1/events/' + event_id
 
     # Get the member
-    response = requests.get(url, auth=config.basic_auth)
-    if response.status_code not in [200, 404]:
-        _log_and_exit(url, response, event_file)
+    with profiler.stage('detail fetch'):
+        response = _get(instance, url, config.ERR_REQUEST_EXCEPCTION_CODE)
+    return _event_details(instance, url, event_id, response.status_code,
+                          response.content, raw)
 
-    # Process the response
-    body = response.json()
-    _logger.debug("Event %s - json body: %s", event_id, pprint.pformat(body))
-    event_properties = {}
-
-    for prop_key in _event_prop_list:
-        prop_name = prop_key if ':' not in prop_key else prop_key.split(':')[0]
-        event_properties[prop_name] = "N/A"
-
-        if prop_key == 'event_id':
-            event_properties['event_id'] = event_id
-        elif response.status_code == 200:
-            if '.' in prop_key:
-                #dot notation means a reference to a sub-element
-                pk_parts = prop_key.split('.')
-                if pk_parts[0] in body:
-                    event_properties[prop_key] = body[pk_parts[0]][pk_parts[1]]
-            elif ':' in prop_key:
-                #colon notation is a reference to a list of sub-elements
-                pk_parts = prop_key.split(':')
-                if pk_parts[0] in body:
-                    list_data = body[pk_parts[0]]['data']
-                    item_names = pk_parts[1].split('|')
-                    #tupples are separated by commas, values by pipe (|)
-                    event_properties[pk_parts[0]] = ','.join(
-                        [
-                            '|'.join([
-                                str(el[item] if item in el else "")
-                                for item in item_names
-                                ])
-                            for el in list_data
-                        ])
-            else:
-                if prop_key in body:
-                    event_properties[prop_key] = body[prop_key]
-
-    return event_properties
-
-def _process_event(event_file: TextIOBase, event_id: str, include_notifs: bool):
+def _process_event(writer: event_row.RowWriter, event_id: str,
+                   event_details: event_row.EventRow,
+                   summary: event_summary.EventSummary = None,
+                   row_filter: event_filter.EventFilter = None,
+                   delta: event_delta.DeltaIndex = None) -> bool:
     """Writes out the detailed properties for the event defined by event_id.
 
-    Retrieves the Event object details from xmatters based on the event_id.
-    The details are converted to a property array that is then written out
-    to event_file.
-    If include_notifs is true, then also find and return the associated
-    notification data (status, delivery, response) related to this event.
+    The event details retrieved from xmatters are written out by writer.
 
     Args:
-        event_file (TextIOBase): Open event file to write event data to
+        writer (RowWriter): Writes the rows to the open event file
         event_id (str): The unique identifier for the event object to write out
+        event_details (EventRow): Event properties from _get_event_details
+        summary (EventSummary): When provided, the event is added to it
+        row_filter (EventFilter): When provided, the event is only written
+            if its details match the filter
+        delta (DeltaIndex): When provided, the event is only written if it
+            is new or has changed since the previous report
+
+    Returns:
+        bool: True if the event was written
+    """
+    if row_filter is not None and row_filter.matches(event_details) is not True:
+        _logger.info("Event Id: %s does not match the filters", event_id)
+        return False
+    if delta is not None and not delta.update(event_id, event_details):
+        _logger.info("Event Id: %s has not changed", event_id)
+        return False
+    with profiler.stage('write'):
+        writer.write(event_details)
+        if summary is not None:
+            summary.add(event_details)
+    return True
+
+def _events_list_url(list_filter: event_filter.EventFilter, start: str = None,
+                     end: str = None) -> str:
+    """Returns the resource path of the first page of the events list
+
+    Args:
+        list_filter (EventFilter): Filters to push down to the list request
+        start (str): Range start, defaults to config.event_range_start
+        end (str): Range end, defaults to config.event_range_end
+    """
+    url = ('/reapi/2015-01-01/events?range=' +
+           (start or config.event_range_start) + '/' +
+           (end or config.event_range_end))
+    if list_filter.query_params():
+        url += '&' + urlencode(list_filter.query_params())
+    return url
+
+def _events_list_page(instance: Instance, url: str, status_code: int,
+                      content: bytes) -> dict:
+    """Converts the response to an events list request to its body
+
+    Args:
+        instance (Instance): The instance the events are listed from
+        url (str): Resource path of the page
+        status_code (int): HTTP status of the response
+        content (bytes): Body of the response
+
+    Returns:
+        dict: body, holding the total, records and nextRecordsUrl
+    """
+    if status_code != 200:
+        _log_and_raise(instance.xmod_url + url, status_code, content)
+    body = json.loads(content)
+    _logger.info("[%s] Retrieved a page of %d records from a range of %d "
+                 "events.", instance.name, len(body['records']),
+                 body['total'])
+    _logger.debug("nextRecordsUrl: %s", str(body['nextRecordsUrl']))
+    return body
+
+def _list_events(instance: Instance, list_filter: event_filter.EventFilter):
+    """Pages through the list of events in the range from instance.
+
+    Args:
+        instance (Instance): The instance to list events from
+        list_filter (EventFilter): Filters to push down to the list request
+
+    Yields:
+        tuple: (record, total) for each event record in the range
+    """
+    url = _events_list_url(list_filter)
+    rc = config.ERR_REQUEST_EXCEPCTION_CODE
+
+    # Continue until we exhaust the event list
+    while True:
+        with profiler.stage('list paging'):
+            response = _get(instance, url, rc)
+            body = _events_list_page(instance, url, response.status_code,
+                                     response.content)
+        for record in body['records']:
+            yield record, body['total']
+
+        # If there are more events to get, then request the next page
+        next_records_url = body['nextRecordsUrl']
+        if not next_records_url:
+            break
+        _logger.info("[%s] Getting next set of events from %s",
+                     instance.name, next_records_url)
+        url = next_records_url
+        rc = config.ERR_REQUEST_NEXT_EXCEPCTION_CODE
+
+def _select_event(instance: Instance, cnt: int, num_events: int, record: dict,
+                  list_filter: event_filter.EventFilter):
+    """Decides whether the details of a listed event are needed.
+
+    Args:
+        instance (Instance): The instance the event was listed from
+        cnt (int): Position of the record in the events list
+        num_events (int): Number of events in the range
+        record (dict): The event's record from the events list
+        list_filter (EventFilter): Filters the events that are written
+
+    Returns:
+        tuple: (event_id, row_filter) where row_filter must be applied to the
+            event details, or None if the list record is filtered out
+    """
+    _logger.info('[%s] Listing Event #%d of %d: href="%s"', instance.name,
+                 cnt, num_events, record['href'])
+    if _progress is not None:
+        _progress.set_total(instance.name, num_events)
+    # Skip events the list record already rules out
+    match = list_filter.matches(record) if list_filter else True
+    if match is False:
+        if _progress is not None:
+            _progress.add_done(instance.name)
+        return None
+    # Parse off the event id
+    return record['href'].split("/")[4], list_filter if match is None else None
+
+def _budget_exhausted() -> bool:
+    """Returns True when the memory budget calls for fetching to pause"""
+    return _memory_budget is not None and _memory_budget.exhausted()
+
+def _fetch_with_threads(instance: Instance, include_notifs: bool,
+                        list_filter: event_filter.EventFilter, on_event,
+                        raw: bool = False):
+    """Retrieves the events in the range using a pool of worker threads.
+
+    Event details are requested by up to instance.max_workers threads and
+    passed to on_event in list order.  At most two requests per worker are
+    in flight, and none are added while the memory budget is exhausted.
+
+    Args:
+        instance (Instance): The instance to report on
         include_notifs (bool): When true, collect and write out notifications
+        list_filter (EventFilter): Filters the events that are written
+        on_event (callable): Called with (event_id, row_filter, event) for
+            each event
+        raw (bool): When true, on_event is passed the undecoded responses,
+            as (status_code, content), rather than the events
+
+    Returns:
+        tuple: (events listed, events in the range)
     """
-    _logger.info("Processing Event Id: %s, include_notifs: %s",
-                 event_id, str(include_notifs))
-    event_details = _get_event_details(event_id, event_file)
-    _write_event(event_file, event_details)
+    cnt = 0
+    num_events = 0
+    window = 2 * instance.max_workers
+    pending = deque()
+
+    with ThreadPoolExecutor(
+            max_workers=instance.max_workers,
+            thread_name_prefix=instance.name) as executor:
+        try:
+            for record, num_events in _list_events(instance, list_filter):
+                cnt += 1
+                selected = _select_event(instance, cnt, num_events, record,
+                                         list_filter)
+                if selected is None:
+                    continue
+                pending.append(selected + (executor.submit(
+                    _get_event_details, instance, selected[0],
+                    include_notifs, raw),))
+                while pending and (len(pending) >= window or
+                                   _budget_exhausted()):
+                    event_id, row_filter, future = pending.popleft()
+                    on_event(event_id, row_filter, future.result())
+            while pending:
+                event_id, row_filter, future = pending.popleft()
+                on_event(event_id, row_filter, future.result())
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+    return cnt, num_events
+
+def _auth_headers(instance: Instance) -> dict:
+    """Returns the headers that the instance's auth adds to a request
+
+    Lets the asyncio engine reuse the requests auth object of the instance.
+    Any new access token must be fetched beforehand, as by
+    _fetch_events_async, so the event loop is not blocked.
+
+    Args:
+        instance (Instance): The instance the request is sent to
+    """
+    if instance.auth is None:
+        return {}
+    prepared = instance.auth(requests.Request('GET', instance.xmod_url)
+                             .prepare())
+    return {k: v for k, v in prepared.headers.items() if k == 'Authorization'}
+
+class _AsyncClient(object):
+    """Makes the asyncio engine's requests to an instance
+
+    Args:
+        aiohttp (module): The aiohttp package
+        instance (Instance): The instance the requests are sent to
+        session (ClientSession): Session the requests are made in
+    """
+    def __init__(self, aiohttp, instance: Instance, session):
+        self._aiohttp = aiohttp
+        self._instance = instance
+        self._session = session
+        self._semaphore = asyncio.Semaphore(instance.max_workers)
+
+    async def auth_headers(self) -> dict:
+        """Returns the headers that authenticate a request
+
+        Any new access token is fetched in an executor, so the event loop is
+        not blocked while it is requested.
+        """
+        auth = self._instance.auth
+        if isinstance(auth, token_auth.TokenAuth) and not auth.fresh:
+            await asyncio.get_running_loop().run_in_executor(
+                None, auth.access_token)
+        return _auth_headers(self._instance)
+
+    async def get(self, url: str, rc: int, stage: str) -> tuple:
+        """GETs url from the instance, returning (status, content)
+
+        A request refused because its access token was revoked is retried
+        once with a new token.
+        """
+        instance = self._instance
+        async with self._semaphore:
+            started = time.perf_counter()
+            if _progress is not None:
+                _progress.request_started(instance.name)
+            try:
+                for retry in [False, True]:
+                    headers = await self.auth_headers()
+                    async with self._session.get(instance.xmod_url + url,
+                                                 headers=headers) as response:
+                        if response.status == 401 and not retry and \
+                                _token_rejected(instance, headers):
+                            continue
+                        return response.status, await response.read()
+            except (self._aiohttp.ClientError, asyncio.TimeoutError,
+                    requests.exceptions.RequestException) as e:
+                _logger.error(config.ERR_REQUEST_EXCEPTION_MSG,
+                              instance.xmod_url + url, repr(e))
+                raise _RequestError(config.ERR_REQUEST_EXCEPTION_MSG % (
+                    instance.xmod_url + url, repr(e)), rc)
+            finally:
+                profiler.record(stage, time.perf_counter() - started)
+                if _progress is not None:
+                    _progress.request_finished(instance.name)
+
+    async def list_pages(self, list_filter: event_filter.EventFilter):
+        """Yields the pages of the events list
+
+        The next page is requested while the current one is processed.
+        """
+        instance = self._instance
+        url = _events_list_url(list_filter)
+        page = asyncio.ensure_future(
+            self.get(url, config.ERR_REQUEST_EXCEPCTION_CODE, 'list paging'))
+        try:
+            while page is not None:
+                page_url = url
+                status, content = await page
+                with profiler.stage('list paging'):
+                    body = _events_list_page(instance, page_url, status,
+                                             content)
+                page = None
+                if body['nextRecordsUrl']:
+                    url = body['nextRecordsUrl']
+                    _logger.info("[%s] Getting next set of events from %s",
+                                 instance.name, url)
+                    page = asyncio.ensure_future(self.get(
+                        url, config.ERR_REQUEST_NEXT_EXCEPCTION_CODE,
+                        'list paging'))
+                yield body
+        finally:
+            if page is not None:
+                page.cancel()
+                await asyncio.gather(page, return_exceptions=True)
+
+    async def get_event_details(self, event_id: str, include_notifs: bool,
+                                raw: bool) -> Union[event_row.EventRow, tuple]:
+        """Coroutine equivalent of _get_event_details"""
+        _logger.info("[%s] Processing Event Id: %s, include_notifs: %s",
+                     self._instance.name, event_id, str(include_notifs))
+        url = '/api/xm/1/events/' + event_id
+        status, content = await self.get(
+            url, config.ERR_REQUEST_EXCEPCTION_CODE, 'detail fetch')
+        return _event_details(self._instance, url, event_id, status, content,
+                              raw)
+
+async def _deliver(on_event, event_id: str, row_filter, task):
+    """Passes the event of a detail request on to on_event once it is done
+
+    on_event is awaited when it is a coroutine function, such as
+    _DecodePipeline.put.
+    """
+    delivered = on_event(event_id, row_filter, await task)
+    if asyncio.iscoroutine(delivered):
+        await delivered
+
+async def _fetch_events_async(aiohttp, instance: Instance,
+                              include_notifs: bool,
+                              list_filter: event_filter.EventFilter, on_event,
+                              raw: bool = False):
+    """Coroutine behind _fetch_with_asyncio
+
+    The next page of the events list is requested while the details of the
+    current page are being retrieved.  Every request is made under a
+    semaphore of instance.max_workers, and at most two detail requests per
+    permit are in flight.  No detail requests are added while the memory
+    budget is exhausted.  Proxies are taken from the environment, as they
+    are by requests for the threads engine.
+    """
+    cnt = 0
+    num_events = 0
+    window = 2 * instance.max_workers
+    pending = deque()
+
+    async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=instance.max_workers),
+            trust_env=True) as session:
+        client = _AsyncClient(aiohttp, instance, session)
+        pages = client.list_pages(list_filter)
+        try:
+            async for body in pages:
+                num_events = body['total']
+                for record in body['records']:
+                    cnt += 1
+                    selected = _select_event(instance, cnt, num_events,
+                                             record, list_filter)
+                    if selected is None:
+                        continue
+                    pending.append(selected + (asyncio.ensure_future(
+                        client.get_event_details(selected[0], include_notifs,
+                                                 raw)),))
+                    while pending and (len(pending) >= window or
+                                       _budget_exhausted()):
+                        await _deliver(on_event, *pending.popleft())
+            while pending:
+                await _deliver(on_event, *pending.popleft())
+        finally:
+            await pages.aclose()
+            for _, _, task in pending:
+                task.cancel()
+            await asyncio.gather(*[task for _, _, task in pending],
+                                 return_exceptions=True)
+    return cnt, num_events
+
+def _fetch_with_asyncio(instance: Instance, include_notifs: bool,
+                        list_filter: event_filter.EventFilter, on_event,
+                        raw: bool = False):
+    """Retrieves the events in the range using an asyncio event loop.
+
+    Drives the list paging and event detail requests as coroutines, so a
+    single thread can keep thousands of requests in flight.  Events are
+    passed to on_event in list order, exactly as by _fetch_with_threads.
+    Requires the optional aiohttp package.
+
+    Args:
+        instance (Instance): The instance to report on
+        include_notifs (bool): When true, collect and write out notifications
+        list_filter (EventFilter): Filters the events that are written
+        on_event (callable): Called with (event_id, row_filter, event) for
+            each event, and awaited if it is a coroutine function
+        raw (bool): When true, on_event is passed the undecoded responses,
+            as by _fetch_with_threads
+
+    Returns:
+        tuple: (events listed, events in the range)
+    """
+    try:
+        import aiohttp # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise _RequestError(config.ERR_ASYNC_UNAVAILABLE_MSG,
+                            config.ERR_ASYNC_UNAVAILABLE_CODE)
+    return asyncio.run(_fetch_events_async(
+        aiohttp, instance, include_notifs, list_filter, on_event, raw))
+
+_engines = {
+    'threads': _fetch_with_threads,
+    'asyncio': _fetch_with_asyncio
+}
+
+def _get_instance_events(instance: Instance, include_notifs: bool,
+                         list_filter: event_filter.EventFilter):
+    """Writes the events in the range from one instance to its events file.
+
+    The events are retrieved by the engine selected by config.engine.  When
+    there is a decode pool, the responses are decoded and extracted by its
+    worker processes.
+
+    Args:
+        instance (Instance): The instance to report on
+        include_notifs (bool): When true, collect and write out notifications
+        list_filter (EventFilter): Filters the events that are written
+    """
+    # Create and open the output file, then insert the header row
+    event_file = _create_event_out_file(instance.events_filename)
+    writer = event_row.RowWriter(event_file)
+    writer.write_header()
+    summary = event_summary.EventSummary() if config.summary else None
+    delta = None
+    if config.delta:
+        delta = event_delta.DeltaIndex(
+            event_delta.load_index(
+                config.since_report or instance.digest_filename),
+            config.event_range_start, config.event_range_end)
+    written = 0
+    # Payloads of the rows still in the writer's buffer
+    charged = []
+
+    def on_event(event_id, row_filter, event_details):
+        """Writes out each event as it is retrieved"""
+        nonlocal written
+        if _process_event(writer, event_id, event_details, summary,
+                          row_filter, delta):
+            written += 1
+            charged.append((instance.name, event_id))
+        elif _memory_budget is not None:
+            _memory_budget.release((instance.name, event_id))
+        if writer.buffered and _budget_exhausted():
+            with profiler.stage('write'):
+                writer.flush()
+        if not writer.buffered:
+            # Payloads stay charged until their rows have been written
+            if _memory_budget is not None:
+                for key in charged:
+                    _memory_budget.release(key)
+            charged.clear()
+        if _progress is not None:
+            _progress.add_done(instance.name)
+
+    # With a decode pool, the engine passes on the undecoded responses
+    # for the pipeline to decode
+    pipeline = None
+    write = on_event
+    if _decode_pool is not None:
+        pipeline = _DecodePipeline(_decode_pool, on_event,
+                                   2 * config.decode_workers)
+        # The asyncio engine awaits the decoded batches
+        write = pipeline.put if config.engine == 'asyncio' else pipeline
+    try:
+        cnt, num_events = _engines[config.engine](
+            instance, include_notifs, list_filter, write,
+            pipeline is not None)
+        if pipeline is not None:
+            pipeline.flush()
+    finally:
+        with profiler.stage('write'):
+            writer.flush()
+        event_file.close()
+        instance.close()
+        if _memory_budget is not None:
+            _memory_budget.release_group(instance.name)
+
+    _logger.info("[%s] Retrieved a total of %d from a possible %d events.",
+                 instance.name, written, num_events)
+    if list_filter:
+        _logger.info("[%s] %d events did not match the filters.",
+                     instance.name,
+                     cnt - written - (delta.unchanged if delta else 0))
+    _write_instance_extras(instance, delta, summary)
+
+def _write_instance_extras(instance: Instance,
+                           delta: event_delta.DeltaIndex = None,
+                           summary: event_summary.EventSummary = None):
+    """Writes the files that accompany an instance's events file
+
+    Called once the events file is complete, to write the digest index and
+    tombstones in delta mode and the summary, and to sort the events file.
+
+    Args:
+        instance (Instance): The instance reported on
+        delta (DeltaIndex): Index of the delta run, if any
+        summary (EventSummary): Summary of the events written, if any
+    """
+    if delta is not None:
+        _logger.info("[%s] Delta: %d new, %d changed and %d unchanged events.",
+                     instance.name, delta.new, delta.changed, delta.unchanged)
+        if config.tombstones:
+            tombstones_filename = (
+                instance.events_filename[:-len('.csv')] + '-tombstones.csv')
+            _logger.info("[%s] Wrote %d tombstones to %s", instance.name,
+                         delta.write_tombstones(tombstones_filename),
+                         tombstones_filename)
+        delta.write(instance.digest_filename)
+        _logger.info("[%s] Digest index written to %s", instance.name,
+                     instance.digest_filename)
+    if summary is not None:
+        summary.write(instance.events_filename)
+        _logger.info("[%s] Summary of %d events written next to %s",
+                     instance.name, summary.events, instance.events_filename)
+    if config.sort_output:
+        event_merger.merge_files([instance.events_filename],
+                                 instance.events_filename)
 
 def get_events(include_notifs: bool):
-    """Request the list of events from this instance.
+    """Request the list of events from each configured instance.
 
     Iterate through the events and if requested, get the
     notifications to be written to the output file.
+    The instances are processed concurrently, and a failure on one instance
+    does not stop the others.  Once all have finished, the process exits if
+    any instance failed.
 
     Args:
         include_notifs (bool): When true, collect and write out notifications
     """
-    global _logger # pylint: disable=global-statement
+    # pylint: disable=global-statement
+    global _logger, _decode_pool, _memory_budget, _progress
 
     ### Get the current logger
     _logger = ear_logger.get_logger()
 
-    # Create and open the output file, then insert the header row
-    event_file = _create_event_out_file(config.events_filename)
-    _write_event_header(event_file)
+    list_filter = event_filter.EventFilter(config.event_filters)
+    instances = config.instances
+    failures = []
+    if config.max_rss > 0:
+        _memory_budget = memory_budget.MemoryBudget(config.max_rss * 1024 ** 2)
+        if _memory_budget.starts_exhausted:
+            # Fetching would be paused for the whole run
+            baseline_mb = _memory_budget.baseline_rss // 1024 ** 2
+            _memory_budget = None
+            _logger.error(config.ERR_MAX_RSS_TOO_LOW_MSG, config.max_rss,
+                          baseline_mb, 2 * baseline_mb)
+            sys.exit(config.ERR_MAX_RSS_TOO_LOW_CODE)
+        _logger.info("Memory budget: %d MB RSS, %d bytes of payloads in "
+                     "flight.", config.max_rss,
+                     _memory_budget.payload_budget)
+    if config.decode_workers > 0:
+        _logger.info("Decoding events with %d worker processes.",
+                     config.decode_workers)
+        _decode_pool = ProcessPoolExecutor(
+            max_workers=config.decode_workers,
+            mp_context=multiprocessing.get_context('spawn'))
+    if config.progress_interval > 0:
+        _progress = progress.ProgressReporter(
+            config.progress_interval,
+            config.log_filename[:-len('.log')] + '-status.json', _logger)
+        _logger.info("Reporting progress every %g seconds to %s",
+                     config.progress_interval, _progress.status_filename)
+        _progress.start()
+    try:
+        _run_instances(instances, include_notifs, list_filter, failures)
+    finally:
+        if _progress is not None:
+            _progress.stop()
+            _progress = None
+        if _decode_pool is not None:
+            _decode_pool.shutdown(cancel_futures=True)
+            _decode_pool = None
+        if _memory_budget is not None:
+            _logger.info("Memory budget: peak %d bytes of payloads in flight,"
+                         " peak RSS %d bytes, fetching paused %d times.",
+                         _memory_budget.peak_in_flight,
+                         _memory_budget.peak_rss, _memory_budget.throttled)
+            _memory_budget = None
 
-    # Set our resource URLs
-    baseURL = config.xmod_url + '/reapi/2015-01-01/events?range='
-    url = baseURL + config.event_range_start + '/' + config.event_range_end
+    if failures:
+        _logger.error("%d of %d instances failed.", len(failures),
+                      len(instances))
+        sys.exit(failures[0])
 
-    # Initialize loop with first request
-    try:
-        response = requests.get(url, auth=config.basic_auth)
-    except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPCTION_CODE, url, repr(e))
-        event_file.close()
-        sys.exit(config.ERR_REQUEST_EXCEPCTION_CODE)
+def _run_instances(instances: list, include_notifs: bool,
+                   list_filter: event_filter.EventFilter, failures: list):
+    """Processes the instances concurrently, collecting their failures
 
-    # If the initial response fails, then just terminate the process
-    if response.status_code != 200:
-        _log_and_exit(url, response, event_file)
+    Args:
+        instances (list): The Instance objects to report on
+        include_notifs (bool): When true, collect and write out notifications
+        list_filter (EventFilter): Filters the events that are written
+        failures (list): Result code of each failed instance is appended
+    """
+    with ThreadPoolExecutor(max_workers=len(instances)) as executor:
+        futures = [
+            (instance, executor.submit(
+                _get_instance_events, instance, include_notifs, list_filter))
+            for instance in instances
+        ]
+        for instance, future in futures:
+            try:
+                future.result()
+            except _RequestError as e:
+                _logger.error("[%s] Stopped: %s", instance.name, str(e))
+                failures.append(e.result_code)
+            except Exception as e: # pylint: disable=broad-except
+                _logger.error("[%s] Stopped: %s", instance.name, repr(e))
+                failures.append(config.ERR_CLI_EXCEPTION)
 
-    # Continue until we exhaust the group list
-    cnt = 0
-    num_events = 1
-    while response.status_code == 200:
+def _measure_instance(instance: Instance,
+                      list_filter: event_filter.EventFilter,
+                      windows: list) -> dict:
+    """Measures what a run against instance would involve.
 
-        # Iterate through the result set
-        body = response.json()
-        num_events = body['total']
-        _logger.info("Retrieved a batch of %d events.", body['total'])
-        next_records_url = body['nextRecordsUrl']
-        _logger.debug("nextRecordsUrl: %s", str(next_records_url))
-        for d in body['records']:
-            cnt += 1
-            _logger.info('Processing Event #%d of %d: href="%s"', \
-                  cnt, body['total'], d['href'])
-            # Parse off the event id
-            eventId = d['href'].split("/")[4]
-            _process_event(event_file, eventId, include_notifs)
-
-        # If there are more groups to get, then request the next page
-        if not next_records_url:
-            break
+    Makes one events list request per sub-window, to learn its total, and
+    one event details request, to learn the latency and size of an event.
+    The list records are run through list_filter, to learn the share of the
+    events whose details would be requested.
 
-        _logger.info("Getting next set of events from %s", next_records_url)
-        url = config.xmod_url + next_records_url
-        try:
-            response = requests.get(url, auth=config.basic_auth)
-        except requests.exceptions.RequestException as e:
-            _logger.error(config.ERR_REQUEST_EXCEPCTION_CODE, url, repr(e))
-            event_file.close()
-            sys.exit(config.ERR_REQUEST_NEXT_EXCEPCTION_CODE)
+    Args:
+        instance (Instance): The instance to measure
+        list_filter (EventFilter): Filters to push down to the list requests
+        windows (list): (start, end) of each sub-window
+
+    Returns:
+        dict: measurements, as expected by run_planner.estimate()
+    """
+    measured = []
+    page_size = 0
+    listed = 0
+    selected = 0
+    list_seconds = 0.0
+    sample_href = None
+    for start, end in windows:
+        url = _events_list_url(list_filter, start, end)
+        started = time.perf_counter()
+        response = _get(instance, url, config.ERR_REQUEST_EXCEPCTION_CODE)
+        list_seconds += time.perf_counter() - started
+        body = _events_list_page(instance, url, response.status_code,
+                                 response.content)
+        if body['nextRecordsUrl']:
+            page_size = max(page_size, len(body['records']))
+        if sample_href is None and body['records']:
+            sample_href = body['records'][0]['href']
+        for record in body['records']:
+            listed += 1
+            if not list_filter or list_filter.matches(record) is not False:
+                selected += 1
+        measured.append({'start': start, 'end': end, 'total': body['total']})
+
+    list_latency = list_seconds / len(windows)
+    detail_latency = list_latency
+    row_bytes = 0
+    if sample_href is not None:
+        event_id = sample_href.split("/")[4]
+        url = '/api/xm/1/events/' + event_id
+        started = time.perf_counter()
+        response = _get(instance, url, config.ERR_REQUEST_EXCEPCTION_CODE)
+        detail_latency = time.perf_counter() - started
+        if response.status_code == 200:
+            row_bytes = len(event_row.format_rows([_extract_event(
+                response.status_code, json.loads(response.content))
+            ]).encode('utf-8'))
+    return {
+        'windows': measured,
+        'pageSize': page_size,
+        'listLatency': list_latency,
+        'detailLatency': detail_latency,
+        'rowBytes': row_bytes,
+        'detailShare': selected / listed if listed else 1.0
+    }
+
+def plan_events(windows: int, target_seconds: float, apply: bool,
+                failures: list) -> list:
+    """Estimates the cost of reporting on the range for each instance.
 
-    else:
-        _logger.info("Retrieved a total of %d from a possible %d events.",
-                     cnt, num_events)
+    An instance that cannot be measured is left out of the plans, and
+    keeps its worker count, without affecting the other instances.
 
-    event_file.close()
+    Args:
+        windows (int): Number of sub-windows the range is measured in
+        target_seconds (float): Desired duration of a run or shard
+        apply (bool): When true, each instance's max_workers is set to the
+            suggested worker count
+        failures (list): Result code of each instance that could not be
+            planned is appended
+
+    Returns:
+        list: plan of each instance planned, from run_planner.estimate()
+    """
+    global _logger # pylint: disable=global-statement
+
+    ### Get the current logger
+    _logger = ear_logger.get_logger()
+
+    list_filter = event_filter.EventFilter(config.event_filters)
+    sub_windows = run_planner.split_range(
+        config.event_range_start, config.event_range_end, windows)
+    plans = []
+    for instance in config.instances:
+        try:
+            measurements = _measure_instance(instance, list_filter,
+                                             sub_windows)
+        except _RequestError as e:
+            _logger.error("[%s] Unable to plan: %s", instance.name, str(e))
+            failures.append(e.result_code)
+            continue
+        except Exception as e: # pylint: disable=broad-except
+            _logger.error("[%s] Unable to plan: %s", instance.name, repr(e))
+            failures.append(config.ERR_CLI_EXCEPTION)
+            continue
+        finally:
+            instance.close()
+        plan = run_planner.estimate(measurements, config.engine,
+                                    target_seconds)
+        plan['instance'] = instance.name
+        _logger.info("[%s] Plan: %d events, %d API calls, about %.0f s with "
+                     "%d workers in %d shards, %d bytes of output.",
+                     instance.name, plan['events'],
+                     plan['apiCalls']['total'],
+                     plan['estimatedSeconds']['suggested'],
+                     plan['suggested']['workers'],
+                     len(plan['suggested']['shards']),
+                     plan['estimatedOutputBytes'])
+        if apply:
+            instance.max_workers = plan['suggested']['workers']
+        plans.append(plan)
+    return plans
 
 def main():
     """In case we need to execute the module directly"""
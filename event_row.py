@@ -0,0 +1,126 @@
+"""Compact representation of the rows of the events file
+
+Each event is extracted to an EventRow, a tuple holding the value of each
+column in a fixed order, rather than to a dict keyed by column name.  This
+drops the per-row hash table, which dominates the memory used by rows that
+are in flight or buffered, and makes rows cheap to send between processes.
+RowWriter buffers the rows and writes them to the events file in batches.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+from io import TextIOBase
+
+# Properties written for each event, in column order.  Dots name a property
+# of a sub-element, and a colon names a list of sub-elements followed by the
+# properties written for each, separated by pipes (|).
+PROPERTIES = (
+    'eventId', 'created', 'terminated', 'submitter.targetName', 'status',
+    'priority', 'incident', 'recipients.total', 'recipients.count',
+    'recipients:recipientType|targetName|status', 'responseOptions.total',
+    'responseOptions.count', 'responseOptions:number|text|action|contribution',
+    'expirationInMinutes', 'id', 'form.id'
+)
+
+# Name of each column, which is the property up to any colon
+COLUMNS = tuple(p.split(':')[0] for p in PROPERTIES)
+
+_COLUMN_INDEX = {name: index for index, name in enumerate(COLUMNS)}
+
+# Rows written to the events file at a time
+BATCH_SIZE = 4096
+
+# Largest field accepted when reading the events file with the csv module,
+# as recipient lists can be very long
+FIELD_SIZE_LIMIT = 2 ** 31 - 1
+
+class EventRow(tuple):
+    """The values of an event's columns, in the order of COLUMNS
+
+    Besides the tuple interface, values can be looked up by column name with
+    row[name] and row.get(name), so a row can be used wherever a dict of
+    column name to value was used.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, _COLUMN_INDEX[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, name):
+        return name in _COLUMN_INDEX
+
+    def get(self, name: str, default=None):
+        """Returns the value of column name, or default if there is none"""
+        index = _COLUMN_INDEX.get(name)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self) -> tuple:
+        """Returns the column names"""
+        return COLUMNS
+
+    def values(self) -> tuple:
+        """Returns the column values"""
+        return tuple(self)
+
+    def as_dict(self) -> dict:
+        """Returns the row as a dict of column name to value"""
+        return dict(zip(COLUMNS, self))
+
+def format_rows(rows: list) -> str:
+    """Returns rows in the events file format, one line per row
+
+    Every value is written as a string and enclosed in double quotes, with
+    any double quotes in it doubled, so the rows can be read back with the
+    csv module.
+    """
+    return ''.join([
+        '"' + '","'.join([str(value).replace('"', '""') for value in row]) +
+        '"\n'
+        for row in rows
+    ])
+
+class RowWriter(object):
+    """Buffers event rows and writes them to the events file in batches
+
+    Args:
+        out_file (TextIOBase): Open events file
+        batch_size (int): Number of rows buffered before they are written
+    """
+    def __init__(self, out_file: TextIOBase, batch_size: int = BATCH_SIZE):
+        self._out_file = out_file
+        self._batch_size = batch_size
+        self._rows = []
+        self.written = 0
+
+    @property
+    def buffered(self) -> int:
+        """Number of rows waiting to be written"""
+        return len(self._rows)
+
+    def write_header(self):
+        """Writes the header row, which holds the properties"""
+        self._out_file.write(format_rows([PROPERTIES]))
+
+    def write(self, row: EventRow):
+        """Adds a row, writing the buffered rows once the batch is full"""
+        self._rows.append(row)
+        if len(self._rows) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows"""
+        if self._rows:
+            self._out_file.write(format_rows(self._rows))
+            self.written += len(self._rows)
+            self._rows = []
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""Accumulates aggregate statistics over the events written to the report
+
+The summary is computed in the same pass that writes the events file, using
+fixed-memory structures so that the cost does not grow with the number of
+events processed:
+
+    * Top-N counters for the categorical columns (status, priority,
+      submitter) and the response option contributions.
+    * A streaming quantile sketch for the time-to-terminate durations.
+    * Columnar numeric buffers that are reduced in batches.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import csv
+import json
+import math
+from array import array
+from datetime import datetime
+
+_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+
+_COUNTED_COLUMNS = ['status', 'priority', 'submitter.targetName']
+
+_NUMERIC_COLUMNS = [
+    'recipients.total', 'recipients.count', 'responseOptions.total',
+    'responseOptions.count', 'expirationInMinutes'
+]
+
+_QUANTILES = [0.5, 0.75, 0.9, 0.95, 0.99]
+
+_TOP_N = 25
+
+# Values kept by each TopCounter, well above _TOP_N so the top values are
+# exact unless the column has thousands of distinct values
+_TOP_CAPACITY = 1024
+
+def _parse_timestamp(value):
+    """Converts an xmatters timestamp to a datetime, or None if not valid
+
+    Args:
+        value (str): Timestamp such as 2017-01-27T16:15:00.000+0000
+
+    Returns:
+        datetime: parsed value or None
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.strptime(value, _TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+def _response_option_contributions(value):
+    """Yields the contribution of each response option in an event row
+
+    The responseOptions column holds tuples separated by commas with the
+    values number|text|action|contribution separated by pipes.  Since the
+    text may itself contain commas, fragments are joined back together until
+    they hold all four values.
+
+    Args:
+        value (str): The joined responseOptions value from an event row
+
+    Yields:
+        str: contribution
+    """
+    if not isinstance(value, str) or value in ('', 'N/A'):
+        return
+    pending = None
+    for fragment in value.split(','):
+        pending = fragment if pending is None else pending + ',' + fragment
+        if pending.count('|') >= 3:
+            contribution = pending.rsplit('|', 1)[1]
+            pending = None
+            if contribution:
+                yield contribution
+
+class QuantileSketch(object):
+    """Streaming quantile estimator with bounded memory
+
+    Values are placed in logarithmically sized buckets so that any reported
+    quantile is within relative_accuracy of the true value.  When more than
+    max_buckets are in use the smallest buckets are collapsed together,
+    which keeps memory fixed at the expense of accuracy for the lowest
+    quantiles.
+
+    Args:
+        relative_accuracy (float): Maximum relative error of the estimates
+        max_buckets (int): Upper bound on the number of buckets kept
+    """
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._max_buckets = max_buckets
+        self._buckets = {}
+        self._zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        """Adds a single non-negative value to the sketch"""
+        self.count += 1
+        if value <= 0:
+            self._zeros += 1
+            return
+        key = int(math.ceil(math.log(value) / self._log_gamma))
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+        if len(self._buckets) > self._max_buckets:
+            keys = sorted(self._buckets)
+            self._buckets[keys[1]] += self._buckets.pop(keys[0])
+
+    def quantile(self, q: float):
+        """Returns the estimated value at quantile q (0 <= q <= 1)
+
+        Returns:
+            float: estimate or None if no values were added
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if rank < seen:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+class TopCounter(object):
+    """Counts the most frequent values with bounded memory
+
+    A space-saving sketch, pruned in batches: once 2 * capacity values are
+    counted, only the capacity most frequent are kept, and the highest count
+    dropped becomes the floor that any value seen afterwards starts from.
+    The counts are exact until the first pruning, and overestimate by at
+    most the floor after that.
+
+    Args:
+        capacity (int): Number of values kept by each pruning
+    """
+    def __init__(self, capacity=_TOP_CAPACITY):
+        self._capacity = capacity
+        self._counts = {}
+        self.floor = 0
+
+    def add(self, value: str):
+        """Counts one occurrence of value"""
+        count = self._counts.get(value)
+        if count is None:
+            if len(self._counts) >= 2 * self._capacity:
+                self._prune()
+            count = self.floor
+        self._counts[value] = count + 1
+
+    def _prune(self):
+        """Keeps the capacity most frequent values and raises the floor"""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1],
+                        reverse=True)
+        self.floor = max(self.floor, ranked[self._capacity][1])
+        self._counts = dict(ranked[:self._capacity])
+
+    def most_common(self, n: int = None) -> list:
+        """Returns (value, count) for the n most frequent values, or all"""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1],
+                        reverse=True)
+        return ranked if n is None else ranked[:n]
+
+class _ColumnBuffer(object):
+    """Collects numeric values for a column and reduces them in batches
+
+    Args:
+        batch_size (int): Number of values held before they are reduced
+    """
+    def __init__(self, batch_size=4096):
+        self._batch_size = batch_size
+        self._values = array('d')
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def append(self, value: float):
+        """Buffers value, reducing the buffer once it is full"""
+        self._values.append(value)
+        if len(self._values) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Folds the buffered values into the running totals"""
+        if not self._values:
+            return
+        low = min(self._values)
+        high = max(self._values)
+        self.count += len(self._values)
+        self.total += math.fsum(self._values)
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+        self._values = array('d')
+
+    def as_dict(self) -> dict:
+        """Returns the reduced statistics for the column"""
+        self.flush()
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.total / self.count if self.count else None
+        }
+
+class EventSummary(object):
+    """Aggregates event rows as they are written to the events file"""
+    def __init__(self):
+        self.events = 0
+        self._counters = {name: TopCounter() for name in _COUNTED_COLUMNS}
+        self._contributions = TopCounter()
+        self._columns = {name: _ColumnBuffer() for name in _NUMERIC_COLUMNS}
+        self._durations = _ColumnBuffer()
+        self._sketch = QuantileSketch()
+
+    def add(self, event: dict):
+        """Adds an event row, as produced for the events file, to the summary
+
+        Args:
+            event (dict): Event properties keyed by column name
+        """
+        self.events += 1
+        for name, counter in self._counters.items():
+            counter.add(str(event.get(name, 'N/A')))
+        for name, column in self._columns.items():
+            value = event.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                column.append(value)
+        for contribution in _response_option_contributions(
+                event.get('responseOptions')):
+            self._contributions.add(contribution)
+        created = _parse_timestamp(event.get('created'))
+        terminated = _parse_timestamp(event.get('terminated'))
+        if created and terminated:
+            seconds = (terminated - created).total_seconds()
+            self._durations.append(seconds)
+            self._sketch.add(seconds)
+
+    def as_dict(self) -> dict:
+        """Returns the summary as a JSON serializable dictionary"""
+        durations = self._durations.as_dict()
+        durations['quantiles'] = {
+            'p%g' % (q * 100): self._sketch.quantile(q) for q in _QUANTILES
+        }
+        counts = {
+            name: dict(counter.most_common(_TOP_N))
+            for name, counter in self._counters.items()
+        }
+        return {
+            'events': self.events,
+            'counts': counts,
+            'responseOptionContributions': dict(
+                self._contributions.most_common(_TOP_N)),
+            'columns': {
+                name: column.as_dict() for name, column in self._columns.items()
+            },
+            'timeToTerminateSeconds': durations
+        }
+
+    def write(self, events_filename: str):
+        """Writes the summary next to the events file
+
+        Creates <name>-summary.json and <name>-summary.csv alongside the
+        events file named events_filename.
+
+        Args:
+            events_filename (str): Name of the events output file
+        """
+        base = events_filename[:-4] if events_filename.endswith('.csv') \
+            else events_filename
+        summary = self.as_dict()
+        with open(base + '-summary.json', 'w') as json_file:
+            json.dump(summary, json_file, indent=2)
+        with open(base + '-summary.csv', 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
+            writer.writerow(['metric', 'key', 'value'])
+            writer.writerow(['events', '', summary['events']])
+            for name, counts in summary['counts'].items():
+                for key, value in counts.items():
+                    writer.writerow([name, key, value])
+            for key, value in summary['responseOptionContributions'].items():
+                writer.writerow(['responseOptions.contribution', key, value])
+            for name, stats in summary['columns'].items():
+                for key, value in stats.items():
+                    writer.writerow([name, key, value])
+            durations = summary['timeToTerminateSeconds']
+            for key, value in durations.items():
+                if key == 'quantiles':
+                    for q_key, q_value in value.items():
+                        writer.writerow(['timeToTerminateSeconds', q_key,
+                                         q_value])
+                else:
+                    writer.writerow(['timeToTerminateSeconds', key, value])
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
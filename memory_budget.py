@@ -0,0 +1,154 @@
+"""Keeps the memory used by a run within a configured budget
+
+The budget is shared by every instance in the run.  Each event details
+response is charged to the budget, by the size of its body, from the time
+it is received until its row has been written.  The engines stop issuing
+new requests, and instead wait for the writer to catch up, whenever the
+budget is exhausted.  The budget counts as exhausted when the bytes in
+flight reach the payload allowance, or when the resident set size of the
+process nears the limit.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import os
+import threading
+import time
+
+import ear_logger
+
+# Fraction of the limits at which fetching is paused
+_HIGH_WATER = 0.8
+
+# Smallest share of max_rss left for payloads, whatever the starting RSS
+_MIN_PAYLOAD_SHARE = 0.25
+
+# Seconds between reads of the resident set size
+_RSS_INTERVAL = 0.1
+
+# Seconds the resident set size may stay above the high water mark before
+# a warning is logged
+_RSS_WARN_SECONDS = 10
+
+def current_rss() -> int:
+    """Returns the resident set size of the process in bytes, or 0 if unknown
+
+    Reads /proc/self/statm, so is only available on Linux.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+class MemoryBudget(object):
+    """Tracks the payload bytes in flight against a resident set size limit
+
+    Args:
+        max_rss (int): Resident set size limit in bytes
+    """
+    def __init__(self, max_rss: int):
+        self.max_rss = max_rss
+        baseline = current_rss()
+        self.payload_budget = max(max_rss - baseline,
+                                  int(max_rss * _MIN_PAYLOAD_SHARE))
+        self._lock = threading.Lock()
+        self._charges = {}
+        self._in_flight = 0
+        self._rss = baseline
+        self._rss_read = time.monotonic()
+        self._rss_high_since = None
+        self._rss_warned = False
+        self._paused = False
+        self.throttled = 0
+        self.peak_in_flight = 0
+        self.peak_rss = baseline
+        self.baseline_rss = baseline
+
+    @property
+    def starts_exhausted(self) -> bool:
+        """True if the RSS was already at the high water mark on creation
+
+        Fetching would then be paused from the start, so the run would
+        proceed one request at a time.
+        """
+        return self.baseline_rss >= _HIGH_WATER * self.max_rss
+
+    @property
+    def in_flight(self) -> int:
+        """Payload bytes currently charged to the budget"""
+        return self._in_flight
+
+    def charge(self, key: tuple, nbytes: int):
+        """Charges the payload of key to the budget until released
+
+        Args:
+            key (tuple): Identifies the payload as (group, id), for example
+                (instance name, event id)
+            nbytes (int): Size of the payload
+        """
+        with self._lock:
+            self._charges[key] = self._charges.get(key, 0) + nbytes
+            self._in_flight += nbytes
+            if self._in_flight > self.peak_in_flight:
+                self.peak_in_flight = self._in_flight
+
+    def release(self, key: tuple):
+        """Releases the payload of key, once it has been written"""
+        with self._lock:
+            self._in_flight -= self._charges.pop(key, 0)
+
+    def release_group(self, group):
+        """Releases every payload of group, e.g. when an instance stops"""
+        with self._lock:
+            for key in [k for k in self._charges if k[0] == group]:
+                self._in_flight -= self._charges.pop(key)
+
+    def exhausted(self) -> bool:
+        """Returns True when no new requests should be issued
+
+        Counts each time fetching is paused, rather than each call made
+        while it is paused, in self.throttled.  Logs a warning if the
+        resident set size stays above the high water mark, as the memory
+        freed by the run is rarely returned to the operating system and
+        fetching then continues one request at a time.
+        """
+        warn = False
+        with self._lock:
+            exhausted = self._in_flight >= _HIGH_WATER * self.payload_budget
+            if not exhausted:
+                now = time.monotonic()
+                if now - self._rss_read >= _RSS_INTERVAL:
+                    self._rss_read = now
+                    self._rss = current_rss()
+                    self.peak_rss = max(self.peak_rss, self._rss)
+                exhausted = self._rss >= _HIGH_WATER * self.max_rss
+                if not exhausted:
+                    self._rss_high_since = None
+                elif self._rss_high_since is None:
+                    self._rss_high_since = now
+                elif not self._rss_warned and \
+                        now - self._rss_high_since >= _RSS_WARN_SECONDS:
+                    self._rss_warned = warn = True
+            if exhausted and not self._paused:
+                self.throttled += 1
+            self._paused = exhausted
+        if warn:
+            ear_logger.get_logger().warning(
+                "Memory budget: RSS of %d bytes has stayed above %d%% of "
+                "the %d byte limit for %d s with only %d bytes of payloads "
+                "in flight.  Freed memory is rarely returned to the "
+                "operating system, so fetching continues one request at a "
+                "time.  Consider raising --max-rss.",
+                self._rss, int(_HIGH_WATER * 100), self.max_rss,
+                _RSS_WARN_SECONDS, self._in_flight)
+        return exhausted
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
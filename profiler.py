@@ -0,0 +1,248 @@
+"""Profiles a run by pipeline stage
+
+When started, the profiler:
+
+    * Times each pipeline stage (list paging, detail fetch, extraction,
+      write and logging), in wall clock and thread CPU seconds.
+    * Samples the stack of every thread that is in a stage at a fixed
+      interval, attributing each sample to that stage.  Threads outside
+      any stage, such as idle pool workers or threads waiting on a future,
+      are not sampled, so their waits do not swamp the profile.  The
+      samples are written in the folded format read by flamegraph.pl and
+      speedscope.
+    * Traces allocations with tracemalloc and reports the top allocation
+      sites, saving the snapshot for later analysis.
+
+When it is not started, stage() returns a shared no-op context manager so
+the instrumented code pays almost nothing.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Seconds between stack samples
+_SAMPLE_INTERVAL = 0.005
+
+# Frames kept per allocation traceback, and allocation sites reported.
+# Reporting by line only needs one frame, and each extra frame adds
+# considerably to the cost of every allocation.
+_TRACEMALLOC_FRAMES = 1
+_TOP_ALLOCATIONS = 25
+
+_NULL_STAGE = contextlib.nullcontext()
+
+_enabled = False
+_lock = threading.Lock()
+_stage_times = {}
+_thread_stages = {}
+_samples = Counter()
+_sampler = None
+_stop_sampling = threading.Event()
+_base_filename = None
+_started = None
+
+class _Stage(object):
+    """Times a stage and marks the current thread as being in it"""
+    __slots__ = ['_name', '_wall', '_cpu']
+
+    def __init__(self, name: str):
+        self._name = name
+        self._wall = 0.0
+        self._cpu = 0.0
+
+    def __enter__(self):
+        _thread_stages.setdefault(threading.get_ident(), []).append(self._name)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self._name, time.perf_counter() - self._wall,
+               time.thread_time() - self._cpu)
+        # Drop the thread's entry once it leaves its outermost stage, so
+        # threads that have finished are not kept
+        thread_id = threading.get_ident()
+        stages = _thread_stages[thread_id]
+        stages.pop()
+        if not stages:
+            del _thread_stages[thread_id]
+        return False
+
+def stage(name: str):
+    """Returns a context manager that profiles the enclosed code as name
+
+    Args:
+        name (str): The pipeline stage, e.g. 'write'
+    """
+    return _Stage(name) if _enabled else _NULL_STAGE
+
+def record(name: str, wall: float, cpu: float = 0.0):
+    """Adds a timing to a stage
+
+    Used directly for work that cannot be enclosed in stage(), such as a
+    coroutine awaiting a response.
+
+    Args:
+        name (str): The pipeline stage
+        wall (float): Elapsed seconds
+        cpu (float): CPU seconds used by the thread
+    """
+    if not _enabled:
+        return
+    with _lock:
+        times = _stage_times.setdefault(name, [0, 0.0, 0.0])
+        times[0] += 1
+        times[1] += wall
+        times[2] += cpu
+
+def is_enabled() -> bool:
+    """Returns True while the profiler is running"""
+    return _enabled
+
+def _code_name(code) -> str:
+    """Returns the name of a code object as used in the folded stacks"""
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+def _sample_stacks():
+    """Body of the sampling thread
+
+    Samples are keyed by the code objects on the stack, and only converted
+    to names once profiling stops, to keep the cost of each sample low.
+    The stages of a thread are changed by the thread itself while it is
+    being sampled, so they may be gone by the time they are read, in which
+    case the thread is skipped like any other thread outside a stage.
+    """
+    own_id = threading.get_ident()
+    current_frames = sys._current_frames # pylint: disable=protected-access
+    while not _stop_sampling.wait(_SAMPLE_INTERVAL):
+        for thread_id, frame in current_frames().items():
+            if thread_id == own_id:
+                continue
+            try:
+                stage_name = _thread_stages[thread_id][-1]
+            except (KeyError, IndexError):
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            _samples[(stage_name, tuple(codes))] += 1
+
+def profile_logger(logger):
+    """Attributes the time spent handling log records to the logging stage
+
+    Args:
+        logger (Logger): The shared logger
+    """
+    handle = logger.handle
+
+    def timed_handle(log_record):
+        with stage('logging'):
+            handle(log_record)
+    logger.handle = timed_handle
+
+def start(base_filename: str):
+    """Starts profiling the run
+
+    Args:
+        base_filename (str): Path and base name of the profile output files
+    """
+    # pylint: disable=global-statement
+    global _enabled, _sampler, _base_filename, _started
+    _base_filename = base_filename
+    _started = time.perf_counter()
+    tracemalloc.start(_TRACEMALLOC_FRAMES)
+    _stop_sampling.clear()
+    _sampler = threading.Thread(target=_sample_stacks, name='profiler',
+                                daemon=True)
+    _sampler.start()
+    _enabled = True
+
+def _fold_samples() -> tuple:
+    """Converts the stack samples to names, clearing them
+
+    Returns:
+        tuple: (samples per stage, samples per folded stack)
+    """
+    stage_samples = Counter()
+    folded_samples = Counter()
+    names = {}
+    for (stage_name, codes), count in _samples.items():
+        stage_samples[stage_name] += count
+        for code in codes:
+            if code not in names:
+                names[code] = _code_name(code)
+        folded_samples[';'.join(
+            [stage_name] + [names[code] for code in reversed(codes)])] += count
+    _samples.clear()
+    return stage_samples, folded_samples
+
+def _write_stages(report, stage_samples: Counter):
+    """Writes the timings and sample count of each stage to the report"""
+    report.write("%-16s %10s %12s %12s %10s\n" % (
+        'Stage', 'Calls', 'Wall (s)', 'CPU (s)', 'Samples'))
+    for name in sorted(set(_stage_times) | set(stage_samples)):
+        calls, wall, cpu = _stage_times.get(name, [0, 0.0, 0.0])
+        report.write("%-16s %10d %12.3f %12.3f %10d\n" % (
+            name, calls, wall, cpu, stage_samples[name]))
+
+def stop() -> list:
+    """Stops profiling and writes the profile output files
+
+    Writes <base>-profile.txt with the stage timings and top allocation
+    sites, <base>-profile.folded with the stack samples, and
+    <base>-profile.tracemalloc with the allocation snapshot, which can be
+    read with tracemalloc.Snapshot.load().
+
+    Returns:
+        list: names of the files written
+    """
+    global _enabled # pylint: disable=global-statement
+    if not _enabled:
+        return []
+    _enabled = False
+    _stop_sampling.set()
+    _sampler.join()
+    elapsed = time.perf_counter() - _started
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)])
+
+    stage_samples, folded_samples = _fold_samples()
+
+    report_filename = _base_filename + '-profile.txt'
+    folded_filename = _base_filename + '-profile.folded'
+    snapshot_filename = _base_filename + '-profile.tracemalloc'
+    with open(report_filename, 'w') as report:
+        report.write("Elapsed: %.3f s\n\n" % elapsed)
+        _write_stages(report, stage_samples)
+        report.write("\nTraced memory: current %d bytes, peak %d bytes\n" % (
+            current, peak))
+        report.write("\nTop %d allocation sites:\n" % _TOP_ALLOCATIONS)
+        for stat in snapshot.statistics('lineno')[:_TOP_ALLOCATIONS]:
+            report.write("%s\n" % stat)
+    with open(folded_filename, 'w') as folded:
+        for stack, count in sorted(folded_samples.items()):
+            folded.write("%s %d\n" % (stack, count))
+    snapshot.dump(snapshot_filename)
+    return [report_filename, folded_filename, snapshot_filename]
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Reports the progress of a run while it is in progress
+
+The engines count each event as it is written or filtered out, and each
+request while it is in flight.  A reporting thread wakes up at a fixed
+interval and, from those counters:
+
+    * Shows the events done of the total, the rate in events per second
+      over a moving window, the estimated time remaining and the number of
+      requests in flight.  The line is rewritten in place when stderr is a
+      terminal, and logged otherwise.
+    * Replaces a small JSON status file, so the run can be watched from
+      another process or a monitoring agent.
+
+The counters are plain integers updated under a lock, so counting costs
+far less than the requests being counted.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Seconds of history the rate is computed over
+_RATE_WINDOW = 60.0
+
+class ProgressReporter(object):
+    """Counts the progress of each instance and reports it periodically
+
+    Args:
+        interval (float): Seconds between reports
+        status_filename (str): JSON status file to refresh, or None
+        logger (Logger): Logger used when stderr is not a terminal
+    """
+    def __init__(self, interval: float, status_filename: str = None,
+                 logger=None):
+        self.interval = interval
+        self.status_filename = status_filename
+        self._logger = logger
+        self._console = sys.stderr.isatty()
+        self._lock = threading.Lock()
+        # instance name -> [done, total, in flight]
+        self._groups = {}
+        self._history = deque()
+        self._started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _counters(self, group: str) -> list:
+        """Returns the counters of group, called with the lock held"""
+        return self._groups.setdefault(group, [0, 0, 0])
+
+    def set_total(self, group: str, total: int):
+        """Sets the number of events in the range of an instance"""
+        with self._lock:
+            self._counters(group)[1] = total
+
+    def add_done(self, group: str, count: int = 1):
+        """Counts events of an instance as written or filtered out"""
+        with self._lock:
+            self._counters(group)[0] += count
+
+    def request_started(self, group: str):
+        """Counts a request to an instance as in flight"""
+        with self._lock:
+            self._counters(group)[2] += 1
+
+    def request_finished(self, group: str):
+        """Counts a request to an instance as no longer in flight"""
+        with self._lock:
+            self._counters(group)[2] -= 1
+
+    def snapshot(self, state: str = 'running') -> dict:
+        """Returns the current progress, as written to the status file
+
+        Args:
+            state (str): 'running' or 'finished'
+        """
+        now = time.monotonic()
+        with self._lock:
+            groups = {name: list(counters)
+                      for name, counters in self._groups.items()}
+        done = sum(c[0] for c in groups.values())
+        total = sum(c[1] for c in groups.values())
+        in_flight = sum(c[2] for c in groups.values())
+
+        # Rate over the moving window
+        self._history.append((now, done))
+        while len(self._history) > 2 and \
+                now - self._history[1][0] >= _RATE_WINDOW:
+            self._history.popleft()
+        then, done_then = self._history[0]
+        rate = (done - done_then) / (now - then) if now > then else 0.0
+        remaining = max(total - done, 0)
+        eta = remaining / rate if rate > 0 else None
+
+        return {
+            'state': state,
+            'updated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'elapsedSeconds': round(now - self._started, 3),
+            'done': done,
+            'total': total,
+            'eventsPerSecond': round(rate, 3),
+            'etaSeconds': None if eta is None else round(eta, 1),
+            'inFlight': in_flight,
+            'instances': {
+                name: {'done': c[0], 'total': c[1], 'inFlight': c[2]}
+                for name, c in groups.items()
+            }
+        }
+
+    def _report(self, state: str):
+        """Shows the current progress and refreshes the status file"""
+        status = self.snapshot(state)
+        line = "%d of %d events (%.0f%%), %.1f events/s, ETA %s, %d in " \
+            "flight" % (
+                status['done'], status['total'],
+                100.0 * status['done'] / status['total']
+                if status['total'] else 0.0,
+                status['eventsPerSecond'],
+                _format_seconds(status['etaSeconds']), status['inFlight'])
+        if self._console:
+            sys.stderr.write("\r" + line + ("\n" if state != 'running'
+                                            else ""))
+            sys.stderr.flush()
+        elif self._logger is not None:
+            self._logger.info("Progress: %s", line)
+        if self.status_filename:
+            updating = self.status_filename + '.updating'
+            with open(updating, 'w') as status_file:
+                json.dump(status, status_file, indent=2)
+            os.replace(updating, self.status_filename)
+
+    def _run(self):
+        """Body of the reporting thread"""
+        while not self._stop.wait(self.interval):
+            self._report('running')
+
+    def start(self):
+        """Starts reporting every interval seconds"""
+        self._started = time.monotonic()
+        self._history.append((self._started, 0))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='progress',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops reporting, after a final report"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._report('finished')
+
+def _format_seconds(seconds) -> str:
+    """Formats seconds as H:MM:SS, or '?' when unknown"""
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Estimates the cost of a report run and suggests how to configure it
+
+The measurements are made by event_processor.plan_events(), with one
+events list request per sub-window of the range and a single event details
+request.  This module splits the range into sub-windows and turns the
+measurements into estimates of the API calls, duration and output size of
+the run, along with a suggested worker count and shard windows.
+
+Filters on status and priority are pushed down to the list requests, so
+the window totals already exclude the events they reject.  The other
+filters are accounted for by the share of the measured list records that
+still need their details requested.  The share is measured on the first
+page of each sub-window only, and events only rejected once their details
+are retrieved still count, so the estimates are an upper bound.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import math
+from datetime import datetime
+
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# Largest worker count suggested for each engine
+_MAX_WORKERS = {
+    'threads': 64,
+    'asyncio': 1024
+}
+
+def split_range(start: str, end: str, windows: int) -> list:
+    """Splits the range from start to end into equal sub-windows
+
+    Args:
+        start (str): Range start, e.g. 2017-01-25T10:45:48.011
+        end (str): Range end in the same format
+        windows (int): Number of sub-windows
+
+    Returns:
+        list: (start, end) for each sub-window
+    """
+    range_start = datetime.strptime(start, _DATE_FORMAT)
+    range_end = datetime.strptime(end, _DATE_FORMAT)
+    windows = max(1, windows)
+    step = (range_end - range_start) / windows
+    bounds = [range_start + step * i for i in range(windows)] + [range_end]
+    return [
+        (bounds[i].strftime(_DATE_FORMAT)[:-3],
+         bounds[i + 1].strftime(_DATE_FORMAT)[:-3])
+        for i in range(windows)
+    ]
+
+def estimate(measurements: dict, engine: str, target_seconds: float) -> dict:
+    """Estimates the cost of a run from the measurements of one instance
+
+    The list pages are requested one after another, while the event details
+    are spread over the workers, so the duration with w workers is
+    estimated as list_calls * list_latency + details * detail_latency / w,
+    where details is the share of the events that the filters do not rule
+    out from their list records.
+    The suggested worker count is the smallest that meets target_seconds,
+    up to the limit for the engine.  When even that is not enough, the
+    windows are grouped into shards that each meet the target.
+
+    Args:
+        measurements (dict): As returned by event_processor for an instance
+        engine (str): The engine the run will use, 'threads' or 'asyncio'
+        target_seconds (float): Desired duration of a run or shard
+
+    Returns:
+        dict: the plan
+    """
+    windows = measurements['windows']
+    page_size = measurements['pageSize']
+    share = measurements.get('detailShare', 1.0)
+    events = sum(w['total'] for w in windows)
+    details = int(math.ceil(events * share))
+    list_calls = sum(
+        max(1, int(math.ceil(w['total'] / float(page_size))))
+        if page_size else 1
+        for w in windows)
+    list_seconds = list_calls * measurements['listLatency']
+    detail_seconds = details * measurements['detailLatency']
+    max_workers = _MAX_WORKERS.get(engine, _MAX_WORKERS['threads'])
+
+    workers = 1
+    if detail_seconds > 0:
+        room = target_seconds - list_seconds
+        workers = max_workers if room <= 0 else int(
+            math.ceil(detail_seconds / room))
+        workers = min(max(workers, 1), max_workers)
+
+    def duration(window_list):
+        """Estimated seconds to report on window_list with workers"""
+        return sum(
+            (max(1, int(math.ceil(w['total'] / float(page_size))))
+             if page_size else 1) * measurements['listLatency'] +
+            w['total'] * share * measurements['detailLatency'] / workers
+            for w in window_list)
+
+    # Group consecutive windows into shards that each meet the target
+    shards = []
+    for window in windows:
+        if shards and duration(shards[-1] + [window]) <= target_seconds:
+            shards[-1].append(window)
+        else:
+            shards.append([window])
+
+    return {
+        'events': events,
+        'windows': windows,
+        'apiCalls': {
+            'list': list_calls,
+            'details': details,
+            'total': list_calls + details
+        },
+        'latencySeconds': {
+            'list': measurements['listLatency'],
+            'details': measurements['detailLatency']
+        },
+        'estimatedSeconds': {
+            'oneWorker': list_seconds + detail_seconds,
+            'suggested': duration(windows)
+        },
+        'estimatedOutputBytes': int(details * measurements['rowBytes']),
+        'suggested': {
+            'engine': engine,
+            'workers': workers,
+            'shards': [
+                {
+                    'start': shard[0]['start'],
+                    'end': shard[-1]['end'],
+                    'events': sum(w['total'] for w in shard),
+                    'estimatedSeconds': duration(shard)
+                }
+                for shard in shards
+            ]
+        }
+    }
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
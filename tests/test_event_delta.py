@@ -0,0 +1,90 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import tempfile
+import unittest
+
+import event_delta
+import event_row
+
+
+def _row(event_id, created, status='ACTIVE', incident='N/A'):
+    """Builds an event row with the given id, created date and status"""
+    values = ['N/A'] * len(event_row.COLUMNS)
+    values[event_row.COLUMNS.index('eventId')] = event_id
+    values[event_row.COLUMNS.index('created')] = created
+    values[event_row.COLUMNS.index('status')] = status
+    values[event_row.COLUMNS.index('incident')] = incident
+    return event_row.EventRow(values)
+
+
+class TestEventDelta(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_filename = os.path.join(self.tmp_dir.name, 'E-digest.csv')
+        first = event_delta.DeltaIndex(
+            {}, '2017-01-01T00:00:00.000', '2017-01-02T00:00:00.000')
+        for event_id in range(1, 4):
+            self.assertTrue(first.update(
+                str(event_id), _row(event_id, '2017-01-01T10:00:00.000+0000')))
+        first.update('9', _row(9, '2016-12-31T10:00:00.000+0000'))
+        first.write(self.index_filename)
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def testDelta(self):
+        baseline = event_delta.load_index(self.index_filename)
+        self.assertEqual(len(baseline), 4)
+        delta = event_delta.DeltaIndex(
+            baseline, '2017-01-01T00:00:00.000', '2017-01-02T00:00:00.000')
+        self.assertFalse(delta.update(
+            '1', _row(1, '2017-01-01T10:00:00.000+0000')))
+        self.assertTrue(delta.update(
+            '2', _row(2, '2017-01-01T10:00:00.000+0000', 'TERMINATED')))
+        self.assertTrue(delta.update(
+            '4', _row(4, '2017-01-01T11:00:00.000+0000')))
+        self.assertEqual((delta.new, delta.changed, delta.unchanged),
+                         (1, 1, 1))
+        # Event 3 is gone, event 9 is outside the range
+        self.assertEqual(delta.tombstones(),
+                         [('3', '2017-01-01T10:00:00.000+0000')])
+        delta.write(self.index_filename)
+        self.assertEqual(sorted(event_delta.load_index(self.index_filename)),
+                         ['1', '2', '4', '9'])
+
+
+    def testMissingDetails(self):
+        delta = event_delta.DeltaIndex(
+            {'7': ('N/A', b'digest')}, '2017-01-01T00:00:00.000',
+            '2017-01-02T00:00:00.000')
+        self.assertEqual(delta.tombstones(), [('7', 'N/A')])
+        delta.write(self.index_filename)
+        self.assertEqual(event_delta.load_index(self.index_filename), {})
+
+
+    def testLoadEventsFile(self):
+        events_filename = os.path.join(self.tmp_dir.name, 'E.csv')
+        row = _row(1, '2017-01-01T10:00:00.000+0000',
+                   incident='inc "quoted", x')
+        with open(events_filename, 'w') as events_file:
+            events_file.write(
+                event_row.format_rows([event_row.PROPERTIES, row]))
+        index = event_delta.load_index(events_filename)
+        self.assertEqual(index, {'1': (
+            '2017-01-01T10:00:00.000+0000', event_delta.row_digest(row))})
+        delta = event_delta.DeltaIndex(
+            index, '2017-01-01T00:00:00.000', '2017-01-02T00:00:00.000')
+        self.assertFalse(delta.update('1', row))
+        self.assertEqual(event_delta.load_index(events_filename + '.x'), {})
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
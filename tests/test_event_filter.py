@@ -0,0 +1,52 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+
+import event_filter
+
+
+class TestEventFilter(unittest.TestCase):
+
+
+    def setUp(self):
+        self.filter = event_filter.EventFilter({
+            'status': ['terminated'], 'submitter': ['jolin']})
+
+
+    def tearDown(self):
+        pass
+
+
+    def testQueryParams(self):
+        self.assertEqual(self.filter.query_params(), {'status': 'TERMINATED'})
+
+
+    def testListRecord(self):
+        self.assertFalse(self.filter.matches({
+            'status': 'ACTIVE', 'submitter': {'targetName': 'jolin'}}))
+        self.assertTrue(self.filter.matches({
+            'status': 'TERMINATED', 'submitter': {'targetName': 'jolin'}}))
+        self.assertIsNone(self.filter.matches({'status': 'TERMINATED'}))
+
+
+    def testEventRow(self):
+        self.assertTrue(self.filter.matches({
+            'status': 'TERMINATED', 'submitter.targetName': 'jolin'}))
+        self.assertIsNone(self.filter.matches({
+            'status': 'TERMINATED', 'submitter.targetName': 'N/A'}))
+
+
+    def testEmpty(self):
+        self.assertFalse(event_filter.EventFilter({}))
+        self.assertTrue(event_filter.EventFilter({}).matches({}))
+
+
+    def testUnknown(self):
+        with self.assertRaises(ValueError):
+            event_filter.EventFilter({'color': ['red']})
+
+
+if __name__ == "__main__":
+    unittest.main()
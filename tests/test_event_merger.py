@@ -0,0 +1,120 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import csv
+import os
+import tempfile
+import unittest
+
+import config
+import event_merger
+
+HEADER = ['eventId', 'created', 'status']
+
+
+class TestEventMerger(unittest.TestCase):
+
+
+    def setUp(self):
+        config.log_filename = os.devnull
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def _write(self, name, rows):
+        filename = os.path.join(self.tmp_dir.name, name)
+        with open(filename, 'w', newline='') as out_file:
+            writer = csv.writer(out_file, quoting=csv.QUOTE_ALL)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+        return filename
+
+
+    def _read(self, filename):
+        with open(filename, newline='') as in_file:
+            return list(csv.reader(in_file))
+
+
+    def testMergeAndDedup(self):
+        first = self._write('a.csv', [
+            ['10', '2017-01-27T16:02:00.000+0000', 'ACTIVE'],
+            ['9', '2017-01-27T16:02:00.000+0000', 'ACTIVE'],
+            ['3', '2017-01-27T16:01:00.000+0000', 'ACTIVE']])
+        second = self._write('b.csv', [
+            ['10', '2017-01-27T16:02:00.000+0000', 'TERMINATED'],
+            ['1', '2017-01-27T16:00:00.000+0000', 'ACTIVE']])
+        out = os.path.join(self.tmp_dir.name, 'out.csv')
+        written, dropped = event_merger.merge_files([first, second], out,
+                                                    run_size=2)
+        self.assertEqual((written, dropped), (4, 1))
+        rows = self._read(out)
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual([r[0] for r in rows[1:]], ['1', '3', '9', '10'])
+        self.assertEqual(rows[-1][2], 'TERMINATED')
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+                         ['a.csv', 'b.csv', 'out.csv'])
+
+
+    def testBoundedFanIn(self):
+        rows = [[str(i), '2017-01-27T16:%02d:00.000+0000' % (i % 60),
+                 'ACTIVE'] for i in range(100, 0, -1)]
+        first = self._write('a.csv', rows)
+        second = self._write('b.csv', [row[:2] + ['TERMINATED']
+                                       for row in rows[::3]])
+        out = os.path.join(self.tmp_dir.name, 'out.csv')
+        self.assertEqual(
+            event_merger.merge_files([first, second], out, run_size=3,
+                                     fan_in=3), (100, 34))
+        merged = self._read(out)[1:]
+        self.assertEqual(merged, sorted(
+            merged, key=lambda row: (row[1], len(row[0]), row[0])))
+        self.assertEqual(sum(row[2] == 'TERMINATED' for row in merged), 34)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)),
+                         ['a.csv', 'b.csv', 'out.csv'])
+
+
+    def testMergeInPlace(self):
+        first = self._write('a.csv', [
+            ['2', '2017-01-27T16:02:00.000+0000', 'ACTIVE'],
+            ['2', '2017-01-27T16:02:00.000+0000', 'ACTIVE']])
+        self.assertEqual(event_merger.merge_files([first], first), (1, 1))
+
+
+    def testQuotedValuesAndMissingEvents(self):
+        first = self._write('a.csv', [
+            ['5', '2017-01-27T16:02:00.000+0000', 'inc "quoted", x'],
+            ['N/A', 'N/A', 'N/A'],
+            ['N/A', 'N/A', 'N/A']])
+        self.assertEqual(event_merger.merge_files([first], first), (3, 0))
+        rows = self._read(first)
+        self.assertEqual(rows[1], ['5', '2017-01-27T16:02:00.000+0000',
+                                 'inc "quoted", x'])
+
+
+    def testMalformedRow(self):
+        first = self._write('a.csv', [['1', '2017-01-27T16:02:00.000+0000']])
+        with open(first) as in_file:
+            original = in_file.read()
+        with self.assertRaises(ValueError):
+            event_merger.merge_files([first], first)
+        with open(first) as in_file:
+            self.assertEqual(in_file.read(), original)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['a.csv'])
+
+
+    def testMismatchedColumns(self):
+        first = self._write('a.csv', [])
+        other = os.path.join(self.tmp_dir.name, 'c.csv')
+        with open(other, 'w') as out_file:
+            out_file.write('"eventId","created"\n')
+        with self.assertRaises(ValueError):
+            event_merger.merge_files([first, other],
+                                     os.path.join(self.tmp_dir.name, 'o.csv'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import csv
+import io
+import pickle
+import unittest
+
+import event_row
+
+
+class TestEventRow(unittest.TestCase):
+
+
+    def setUp(self):
+        self.row = event_row.EventRow(
+            [str(i) for i in range(len(event_row.COLUMNS))])
+
+
+    def tearDown(self):
+        pass
+
+
+    def testLookup(self):
+        self.assertEqual(self.row['eventId'], '0')
+        self.assertEqual(self.row[0], '0')
+        self.assertEqual(self.row['recipients'], '9')
+        self.assertEqual(self.row.get('form.id'), '15')
+        self.assertIsNone(self.row.get('missing'))
+        self.assertIn('status', self.row)
+        self.assertNotIn('0', self.row)
+        self.assertEqual(self.row.as_dict()['status'], '4')
+
+
+    def testPickle(self):
+        row = pickle.loads(pickle.dumps(self.row))
+        self.assertIsInstance(row, event_row.EventRow)
+        self.assertEqual(row, self.row)
+
+
+    def testRowWriter(self):
+        out_file = io.StringIO()
+        writer = event_row.RowWriter(out_file, batch_size=2)
+        writer.write_header()
+        writer.write(self.row)
+        self.assertEqual(writer.written, 0)
+        writer.write(event_row.EventRow(['a"b', 1] + [None] * 14))
+        self.assertEqual(writer.written, 2)
+        writer.write(self.row)
+        writer.flush()
+        lines = out_file.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('"eventId","created",'))
+        self.assertTrue(lines[1].startswith('"0","1","2",'))
+        self.assertTrue(lines[2].startswith('"a""b","1","None",'))
+        self.assertEqual(next(csv.reader([lines[2]]))[:3], ['a"b', '1', 'None'])
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
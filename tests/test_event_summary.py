@@ -0,0 +1,88 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import json
+import os
+import tempfile
+import unittest
+
+import event_summary
+
+
+class TestEventSummary(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def testQuantileSketch(self):
+        sketch = event_summary.QuantileSketch(relative_accuracy=0.01)
+        for value in range(1, 1001):
+            sketch.add(value)
+        self.assertAlmostEqual(sketch.quantile(0.5), 500, delta=10)
+        self.assertAlmostEqual(sketch.quantile(0.99), 990, delta=20)
+
+
+    def testTopCounter(self):
+        counter = event_summary.TopCounter(capacity=4)
+        for _ in range(5):
+            counter.add('common')
+        for value in range(7):
+            counter.add('rare%d' % value)
+        self.assertEqual(counter.most_common(2)[0], ('common', 5))
+        self.assertEqual(counter.floor, 0)
+
+        # A value that stands out keeps its place among many distinct values
+        for value in range(100):
+            counter.add('once%d' % value)
+            if value % 2:
+                counter.add('common')
+        self.assertLessEqual(len(counter.most_common()), 8)
+        self.assertGreater(counter.floor, 0)
+        value, count = counter.most_common(1)[0]
+        self.assertEqual(value, 'common')
+        self.assertGreaterEqual(count, 55)
+        self.assertLessEqual(count, 55 + counter.floor)
+
+
+    def testSummary(self):
+        summary = event_summary.EventSummary()
+        summary.add({
+            'status': 'TERMINATED', 'priority': 'HIGH',
+            'submitter.targetName': 'jolin',
+            'created': '2017-01-27T16:15:00.000+0000',
+            'terminated': '2017-01-27T16:17:00.000+0000',
+            'recipients.total': 3,
+            'responseOptions': '1|Accept, now|ASSIGN_TO_USER|POSITIVE,'
+                               '2|Decline|IGNORE|NEGATIVE'})
+        summary.add({'status': 'ACTIVE', 'priority': 'HIGH',
+                     'created': '2017-01-27T16:20:00.000+0000',
+                     'terminated': 'N/A', 'responseOptions': 'N/A'})
+        result = summary.as_dict()
+        self.assertEqual(result['events'], 2)
+        self.assertEqual(result['counts']['priority'], {'HIGH': 2})
+        self.assertEqual(result['responseOptionContributions'],
+                         {'POSITIVE': 1, 'NEGATIVE': 1})
+        self.assertEqual(result['columns']['recipients.total']['total'], 3)
+        self.assertEqual(result['timeToTerminateSeconds']['count'], 1)
+        self.assertAlmostEqual(
+            result['timeToTerminateSeconds']['quantiles']['p50'], 120,
+            delta=2)
+
+        events_filename = os.path.join(self.tmp_dir.name, 'Events-1.csv')
+        summary.write(events_filename)
+        with open(os.path.join(self.tmp_dir.name,
+                               'Events-1-summary.json')) as json_file:
+            self.assertEqual(json.load(json_file)['events'], 2)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmp_dir.name, 'Events-1-summary.csv')))
+
+
+if __name__ == "__main__":
+    unittest.main()
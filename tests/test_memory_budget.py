@@ -0,0 +1,79 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import unittest
+
+import config
+import ear_logger
+import memory_budget
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+
+    def setUp(self):
+        self.budget = memory_budget.MemoryBudget(1024 ** 4)
+        self.budget.payload_budget = 1000
+
+
+    def tearDown(self):
+        pass
+
+
+    def testCurrentRss(self):
+        self.assertGreaterEqual(memory_budget.current_rss(), 0)
+
+
+    def testChargeAndRelease(self):
+        self.budget.charge(('prod', '1'), 500)
+        self.assertFalse(self.budget.exhausted())
+        self.budget.charge(('prod', '2'), 500)
+        self.assertTrue(self.budget.exhausted())
+        self.budget.release(('prod', '1'))
+        self.assertEqual(self.budget.in_flight, 500)
+        self.assertFalse(self.budget.exhausted())
+        self.assertEqual(self.budget.peak_in_flight, 1000)
+        self.assertEqual(self.budget.throttled, 1)
+
+
+    def testThrottledCountsPauses(self):
+        self.budget.charge(('prod', '1'), 1000)
+        for _ in range(5):
+            self.assertTrue(self.budget.exhausted())
+        self.budget.release(('prod', '1'))
+        self.assertFalse(self.budget.exhausted())
+        self.budget.charge(('prod', '2'), 1000)
+        self.assertTrue(self.budget.exhausted())
+        self.assertEqual(self.budget.throttled, 2)
+
+
+    @unittest.skipUnless(memory_budget.current_rss(), "RSS is unavailable")
+    def testRssWarning(self):
+        config.log_filename = os.devnull
+        budget = memory_budget.MemoryBudget(1)
+        budget.payload_budget = 1000
+        budget._rss_read = 0 # pylint: disable=protected-access
+        with self.assertLogs(ear_logger.get_logger(), 'WARNING'):
+            self.assertTrue(budget.exhausted())
+            # pylint: disable=protected-access
+            budget._rss_high_since -= memory_budget._RSS_WARN_SECONDS
+            self.assertTrue(budget.exhausted())
+
+
+    @unittest.skipUnless(memory_budget.current_rss(), "RSS is unavailable")
+    def testStartsExhausted(self):
+        self.assertTrue(memory_budget.MemoryBudget(1).starts_exhausted)
+        self.assertFalse(self.budget.starts_exhausted)
+
+
+    def testReleaseGroup(self):
+        self.budget.charge(('prod', '1'), 100)
+        self.budget.charge(('test', '1'), 200)
+        self.budget.release_group('prod')
+        self.assertEqual(self.budget.in_flight, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
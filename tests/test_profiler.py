@@ -0,0 +1,88 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        profiler.stop()
+        self.tmp_dir.cleanup()
+
+
+    def testDisabled(self):
+        self.assertFalse(profiler.is_enabled())
+        self.assertIs(profiler.stage('write'), profiler.stage('extraction'))
+        self.assertEqual(profiler.stop(), [])
+
+
+    def testProfile(self):
+        profiler.start(os.path.join(self.tmp_dir.name, 'run'))
+        with profiler.stage('write'):
+            data = [str(i) for i in range(10000)]
+            time.sleep(0.05)
+        profiler.record('detail fetch', 0.5)
+        filenames = profiler.stop()
+        self.assertEqual(len(filenames), 3)
+        with open(filenames[0]) as report:
+            text = report.read()
+        self.assertIn('write', text)
+        self.assertIn('detail fetch', text)
+        with open(filenames[1]) as folded:
+            self.assertTrue(any(line.startswith('write;')
+                                for line in folded))
+        self.assertTrue(data)
+
+
+    def testIdleThreadsAreNotSampled(self):
+        profiler.start(os.path.join(self.tmp_dir.name, 'run'))
+        idle = threading.Event()
+        waiter = threading.Thread(target=idle.wait)
+        waiter.start()
+        with profiler.stage('write'):
+            time.sleep(0.1)
+        idle.set()
+        waiter.join()
+        filenames = profiler.stop()
+        with open(filenames[1]) as folded:
+            stacks = folded.read().splitlines()
+        self.assertTrue(stacks)
+        for stack in stacks:
+            self.assertTrue(stack.startswith('write;'), stack)
+
+
+    def testFinishedThreadsAreDropped(self):
+        profiler.start(os.path.join(self.tmp_dir.name, 'run'))
+
+        seen = []
+
+        def work():
+            with profiler.stage('extraction'):
+                with profiler.stage('write'):
+                    seen.append(list(
+                        profiler._thread_stages[threading.get_ident()]))
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(seen, [['extraction', 'write']] * 4)
+        self.assertEqual(profiler._thread_stages, {})
+        profiler.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import json
+import os
+import tempfile
+import unittest
+
+import progress
+
+
+class TestProgress(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.status_filename = os.path.join(self.tmp_dir.name, 'status.json')
+        self.reporter = progress.ProgressReporter(60, self.status_filename)
+
+
+    def tearDown(self):
+        self.reporter.stop()
+        self.tmp_dir.cleanup()
+
+
+    def testSnapshot(self):
+        self.reporter.start()
+        self.reporter.set_total('prod', 10)
+        self.reporter.set_total('test', 5)
+        self.reporter.add_done('prod', 4)
+        self.reporter.add_done('test')
+        self.reporter.request_started('prod')
+        self.reporter.request_started('prod')
+        self.reporter.request_finished('prod')
+        status = self.reporter.snapshot()
+        self.assertEqual(status['state'], 'running')
+        self.assertEqual(status['done'], 5)
+        self.assertEqual(status['total'], 15)
+        self.assertEqual(status['inFlight'], 1)
+        self.assertEqual(status['instances']['prod'],
+                         {'done': 4, 'total': 10, 'inFlight': 1})
+        self.assertGreater(status['eventsPerSecond'], 0)
+        self.assertIsNotNone(status['etaSeconds'])
+
+
+    def testStatusFile(self):
+        self.reporter.start()
+        self.reporter.set_total('prod', 2)
+        self.reporter.add_done('prod', 2)
+        self.reporter.stop()
+        with open(self.status_filename) as status_file:
+            status = json.load(status_file)
+        self.assertEqual(status['state'], 'finished')
+        self.assertEqual(status['done'], 2)
+        self.assertEqual(status['etaSeconds'], 0.0)
+
+
+    def testFormatSeconds(self):
+        # pylint: disable=protected-access
+        self.assertEqual(progress._format_seconds(None), '?')
+        self.assertEqual(progress._format_seconds(3725.5), '1:02:05')
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,76 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+
+import run_planner
+
+def _measurements(totals, page_size=100, list_latency=0.5,
+                  detail_latency=0.1, row_bytes=200, detail_share=1.0):
+    """Builds measurements of one window per total"""
+    windows = run_planner.split_range(
+        '2017-01-01T00:00:00.000', '2017-01-02T00:00:00.000', len(totals))
+    return {
+        'windows': [{'start': s, 'end': e, 'total': t}
+                    for (s, e), t in zip(windows, totals)],
+        'pageSize': page_size,
+        'listLatency': list_latency,
+        'detailLatency': detail_latency,
+        'rowBytes': row_bytes,
+        'detailShare': detail_share
+    }
+
+class TestRunPlanner(unittest.TestCase):
+
+    def testSplitRange(self):
+        windows = run_planner.split_range(
+            '2017-01-01T00:00:00.000', '2017-01-01T01:00:00.000', 4)
+        self.assertEqual(len(windows), 4)
+        self.assertEqual(windows[0], ('2017-01-01T00:00:00.000',
+                                      '2017-01-01T00:15:00.000'))
+        self.assertEqual(windows[-1][1], '2017-01-01T01:00:00.000')
+        for (_, end), (start, _) in zip(windows, windows[1:]):
+            self.assertEqual(end, start)
+
+    def testEstimateCounts(self):
+        plan = run_planner.estimate(_measurements([250, 0]), 'threads', 3600)
+        self.assertEqual(plan['events'], 250)
+        self.assertEqual(plan['apiCalls'], {
+            'list': 4, 'details': 250, 'total': 254})
+        self.assertEqual(plan['estimatedOutputBytes'], 50000)
+        self.assertAlmostEqual(plan['estimatedSeconds']['oneWorker'], 27.0)
+        self.assertEqual(plan['suggested']['workers'], 1)
+        self.assertEqual(len(plan['suggested']['shards']), 1)
+
+    def testEstimateDetailShare(self):
+        plan = run_planner.estimate(_measurements([250, 0], detail_share=0.2),
+                                    'threads', 3600)
+        self.assertEqual(plan['events'], 250)
+        self.assertEqual(plan['apiCalls'], {
+            'list': 4, 'details': 50, 'total': 54})
+        self.assertEqual(plan['estimatedOutputBytes'], 10000)
+        self.assertAlmostEqual(plan['estimatedSeconds']['oneWorker'], 7.0)
+        self.assertAlmostEqual(plan['estimatedSeconds']['suggested'], 7.0)
+
+    def testEstimateWorkersAndShards(self):
+        # 10000 s of details and 10 s of list pages per window
+        plan = run_planner.estimate(
+            _measurements([10000] * 4, page_size=1000, list_latency=1,
+                          detail_latency=1), 'threads', 600)
+        self.assertEqual(plan['suggested']['workers'], 64)
+        shards = plan['suggested']['shards']
+        self.assertEqual([s['events'] for s in shards], [30000, 10000])
+        self.assertEqual(sum(s['events'] for s in shards), 40000)
+        for shard in shards:
+            self.assertLessEqual(shard['estimatedSeconds'], 600)
+
+        plan = run_planner.estimate(
+            _measurements([10000] * 4, page_size=1000, list_latency=1,
+                          detail_latency=1), 'asyncio', 600)
+        self.assertEqual(plan['suggested']['workers'], 72)
+        self.assertEqual(len(plan['suggested']['shards']), 1)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
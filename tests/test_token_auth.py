@@ -0,0 +1,103 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import stat
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import token_auth
+import xm_stub
+
+
+class TestTokenAuth(unittest.TestCase):
+
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = xm_stub.XmStub(token_delay=0.05)
+        cls.url = cls.stub.url
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.stop()
+
+
+    def setUp(self):
+        self.stub.grants = []
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_filename = os.path.join(self.tmp_dir.name, 'E-token.json')
+        self.auth = token_auth.TokenAuth(self.url, 'user', 'password', 'abc',
+                                         self.cache_filename)
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def testSharedToken(self):
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            tokens = set(pool.map(lambda _: self.auth.access_token(),
+                                  range(64)))
+        self.assertEqual(tokens, {'access-1'})
+        self.assertEqual(self.stub.grants, ['password'])
+        prepared = self.auth(requests.Request('GET', self.url).prepare())
+        self.assertEqual(prepared.headers['Authorization'], 'Bearer access-1')
+
+
+    def testCache(self):
+        self.auth.access_token()
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.cache_filename).st_mode), 0o600)
+        cached = token_auth.TokenAuth(self.url, 'user', 'password', 'abc',
+                                      self.cache_filename)
+        self.assertEqual(cached.access_token(), 'access-1')
+        other = token_auth.TokenAuth(self.url, 'other', 'password', 'abc',
+                                     self.cache_filename)
+        self.assertEqual(other.access_token(), 'access-2')
+        self.assertEqual(self.stub.grants, ['password', 'password'])
+
+
+    def testStaleCacheUpdate(self):
+        with open(self.cache_filename + '.updating', 'w') as stale:
+            stale.write('{}')
+        os.chmod(self.cache_filename + '.updating', 0o644)
+        self.auth.access_token()
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.cache_filename).st_mode), 0o600)
+
+
+    def testRefresh(self):
+        self.auth.access_token()
+        # pylint: disable=protected-access
+        self.auth._token['refreshAt'] = time.time() - 1
+        self.assertEqual(self.auth.access_token(), 'access-2')
+        self.assertEqual(self.stub.grants, ['password', 'refresh_token'])
+
+
+    def testInvalidate(self):
+        self.auth.access_token()
+        self.auth.invalidate('access-0')
+        self.assertTrue(self.auth.fresh)
+        self.auth.invalidate('access-1')
+        self.assertFalse(self.auth.fresh)
+        self.assertEqual(self.auth.access_token(), 'access-2')
+        self.assertEqual(self.stub.grants, ['password', 'refresh_token'])
+
+
+    def testUnavailable(self):
+        auth = token_auth.TokenAuth(self.url + '/missing', 'user', 'password',
+                                    'abc')
+        with self.assertRaises(requests.exceptions.RequestException):
+            auth.access_token()
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
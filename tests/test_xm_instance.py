@@ -0,0 +1,34 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+
+from xm_instance import Instance
+
+
+class TestXmInstance(unittest.TestCase):
+
+
+    def setUp(self):
+        self.instance = Instance('prod', 'https://myco.xmatters.com', None,
+                                 'Events.csv', max_workers=0)
+
+
+    def tearDown(self):
+        self.instance.close()
+
+
+    def testMaxWorkers(self):
+        self.assertEqual(self.instance.max_workers, 1)
+
+
+    def testSessionReused(self):
+        session = self.instance.session
+        self.assertIs(self.instance.session, session)
+        self.instance.close()
+        self.assertIsNot(self.instance.session, session)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+'''
+Created on Oct 19, 2026
+
+A local stand-in for the xmatters REST APIs used by the tests
+'''
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+EVENTS_PATH = '/reapi/2015-01-01/events'
+DETAILS_PATH = '/api/xm/1/events/'
+TOKEN_PATH = '/api/xm/1/oauth2/token'
+PAGE_SIZE = 10
+
+
+def event(event_id):
+    """Returns the details of an event, with a quoted value in some"""
+    return {
+        'eventId': event_id, 'id': 'id-%d' % event_id,
+        'created': '2017-01-27T16:%02d:00.000+0000' % (event_id % 60),
+        'submitter': {'targetName': 'user%d' % (event_id % 3)},
+        'status': ['ACTIVE', 'TERMINATED'][event_id % 2],
+        'incident': 'inc "%d", x' % event_id if event_id % 5 == 0 else 'N/A',
+        'recipients': {'total': 1, 'count': 1, 'data': [
+            {'recipientType': 'PERSON', 'targetName': 'a'}]},
+        'form': {'id': 'form-%d' % (event_id % 2)}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves the events list, event details and token endpoints"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+    def _send(self, code, body):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self): # pylint: disable=invalid-name
+        data = parse_qs(self.rfile.read(
+            int(self.headers['Content-Length'])).decode())
+        if self.path != TOKEN_PATH:
+            return self._send(404, {})
+        stub = self.server.stub
+        with stub.lock:
+            stub.grants.append(data['grant_type'][0])
+            count = len(stub.grants)
+        time.sleep(stub.token_delay)
+        return self._send(200, {
+            'access_token': 'access-%d' % count,
+            'refresh_token': 'refresh-%d' % count, 'expires_in': 3600})
+
+    def do_GET(self): # pylint: disable=invalid-name
+        stub = self.server.stub
+        authorization = self.headers.get('Authorization', '')
+        with stub.lock:
+            if authorization in stub.rejected:
+                stub.unauthorized += 1
+                return self._send(401, {'code': 401})
+        url = urlparse(self.path)
+        if url.path == EVENTS_PATH:
+            offset = int(parse_qs(url.query).get('offset', ['0'])[0])
+            ids = range(offset + 1, min(offset + PAGE_SIZE, stub.events) + 1)
+            next_url = None
+            if offset + PAGE_SIZE < stub.events:
+                next_url = '%s?offset=%d' % (EVENTS_PATH, offset + PAGE_SIZE)
+            return self._send(200, {
+                'total': stub.events, 'nextRecordsUrl': next_url,
+                'records': [{'href': '%s/%d' % (EVENTS_PATH, i)}
+                            for i in ids]})
+        if url.path.startswith(DETAILS_PATH):
+            event_id = int(url.path[len(DETAILS_PATH):])
+            if event_id % 7 == 0:
+                return self._send(404, {'code': 404})
+            return self._send(200, event(event_id))
+        return self._send(404, {'code': 404})
+
+
+class XmStub(object):
+    """Runs the stand-in on a free local port until stopped
+
+    Args:
+        events (int): Number of events in every range
+        token_delay (float): Seconds each token request takes
+    """
+    def __init__(self, events=35, token_delay=0.0):
+        self.events = events
+        self.token_delay = token_delay
+        self.lock = threading.Lock()
+        self.grants = []
+        self.rejected = set()
+        self.unauthorized = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        self.url = 'http://127.0.0.1:%d' % self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+
+    def stop(self):
+        """Stops serving"""
+        self._server.shutdown()
+        self._server.server_close()
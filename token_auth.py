@@ -0,0 +1,185 @@
+"""Authenticates requests with an OAuth access token instead of basic auth
+
+The user's credentials are exchanged once for an access token and a refresh
+token at the instance's /api/xm/1/oauth2/token endpoint.  Every request then
+carries the access token as a bearer token, so the instance does not check
+the password on each request.  The tokens are cached in a file that only
+the user can read, so later runs can start from the cached token, and the
+access token is refreshed shortly before it expires.  The workers share a
+single TokenAuth, which only lets one of them fetch a new token at a time.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.auth import AuthBase
+
+TOKEN_PATH = '/api/xm/1/oauth2/token'
+
+# Seconds to wait for the token endpoint
+_TIMEOUT = 30
+
+# The access token is refreshed when less than this share of its lifetime,
+# or _REFRESH_SECONDS, is left, whichever is shorter
+_REFRESH_SHARE = 0.1
+_REFRESH_SECONDS = 60
+
+class TokenError(requests.exceptions.RequestException):
+    """Raised when an access token cannot be obtained"""
+
+class TokenAuth(AuthBase):
+    """Adds a cached, automatically refreshed access token to requests
+
+    Args:
+        xmod_url (str): Base URL of the instance
+        user (str): xmatters user id
+        password (str): The user's password
+        client_id (str): Client id of the instance, sent with token requests
+        cache_filename (str): File the tokens are cached in, or None
+    """
+    def __init__(self, xmod_url: str, user: str, password: str,
+                 client_id: str, cache_filename: str = None):
+        self.xmod_url = xmod_url
+        self.user = user
+        self._password = password
+        self.client_id = client_id
+        self.cache_filename = cache_filename
+        self._lock = threading.Lock()
+        self._token = None
+        self._load()
+
+    def __call__(self, request):
+        request.headers['Authorization'] = 'Bearer ' + self.access_token()
+        return request
+
+    def _owner(self) -> dict:
+        """Identifies who the cached tokens were issued to"""
+        return {'xmodURL': self.xmod_url, 'user': self.user,
+                'clientId': self.client_id}
+
+    def _load(self):
+        """Reads the cached tokens, if they were issued to the same user"""
+        if not self.cache_filename:
+            return
+        try:
+            with open(self.cache_filename) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        if isinstance(cached, dict) and cached.get('owner') == self._owner():
+            self._token = cached
+
+    def _save(self):
+        """Writes the tokens to the cache file, readable only by the user"""
+        if not self.cache_filename:
+            return
+        updating = self.cache_filename + '.updating'
+        # The mode only applies to a new file, so drop any left by a crash
+        try:
+            os.remove(updating)
+        except FileNotFoundError:
+            pass
+        handle = os.open(updating, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o600)
+        with os.fdopen(handle, 'w') as cache_file:
+            json.dump(self._token, cache_file)
+        os.replace(updating, self.cache_filename)
+
+    @property
+    def fresh(self) -> bool:
+        """Returns True if the access token is not due for refreshing
+
+        When it is not, access_token() makes a blocking request, which the
+        asyncio engine makes in an executor instead.
+        """
+        token = self._token
+        return token is not None and time.time() < token['refreshAt']
+
+    def invalidate(self, access_token: str):
+        """Drops access_token after the instance has rejected it
+
+        Only the current token is dropped, so when several workers report
+        the same rejected token, a single new token is requested.
+
+        Args:
+            access_token (str): The token sent with the rejected request
+        """
+        with self._lock:
+            token = self._token
+            if token is not None and token['accessToken'] == access_token:
+                self._token = dict(token, refreshAt=0)
+
+    def _request_token(self, data: dict) -> dict:
+        """POSTs data to the token endpoint, returning the new token
+
+        Raises:
+            TokenError: if the endpoint cannot be reached or refuses
+        """
+        data['client_id'] = self.client_id
+        try:
+            response = requests.post(self.xmod_url + TOKEN_PATH, data=data,
+                                     timeout=_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            raise TokenError("Unable to request an access token from %s: %s"
+                             % (self.xmod_url + TOKEN_PATH, repr(e)))
+        if response.status_code != 200:
+            raise TokenError("Error %d requesting an access token from %s" % (
+                response.status_code, self.xmod_url + TOKEN_PATH))
+        try:
+            body = json.loads(response.content)
+            lifetime = float(body['expires_in'])
+            access_token = body['access_token']
+        except (ValueError, KeyError, TypeError):
+            raise TokenError("Invalid access token response from %s" % (
+                self.xmod_url + TOKEN_PATH))
+        now = time.time()
+        return {
+            'owner': self._owner(),
+            'accessToken': access_token,
+            'refreshToken': body.get('refresh_token'),
+            'expiresAt': now + lifetime,
+            'refreshAt': now + lifetime - min(lifetime * _REFRESH_SHARE,
+                                              _REFRESH_SECONDS)
+        }
+
+    def access_token(self) -> str:
+        """Returns a valid access token, fetching a new one when needed
+
+        The refresh token is used when there is one, and the credentials
+        otherwise, or when the refresh is refused.
+        """
+        if not self.fresh:
+            with self._lock:
+                # Another worker may have fetched a token while we waited
+                if not self.fresh:
+                    token = None
+                    if self._token is not None and \
+                            self._token.get('refreshToken'):
+                        try:
+                            token = self._request_token({
+                                'grant_type': 'refresh_token',
+                                'refresh_token': self._token['refreshToken']})
+                        except TokenError:
+                            token = None
+                    if token is None:
+                        token = self._request_token({
+                            'grant_type': 'password',
+                            'username': self.user,
+                            'password': self._password})
+                    self._token = token
+                    self._save()
+        return self._token['accessToken']
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Holds the connection settings for each xmatters instance being reported
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class Instance(object):
+    """Connection settings and output location for one xmatters instance
+
+    Each instance keeps its own HTTP session, so connections are reused
+    across the requests made for it, sized to its concurrency limit.
+
+    Args:
+        name (str): Short name used in log messages and output file names
+        xmod_url (str): Base URL of the instance
+            (e.g. https://myco.xmatters.com)
+        auth (AuthBase): Authentication attached to every request
+        events_filename (str): Name of the events output file
+        max_workers (int): Maximum concurrent requests made to the instance
+        digest_filename (str): Name of the digest index kept in delta mode
+    """
+    def __init__(self, name: str, xmod_url: str, auth, events_filename: str,
+                 max_workers: int = 1, digest_filename: str = None):
+        self.name = name
+        self.xmod_url = xmod_url
+        self.auth = auth
+        self.events_filename = events_filename
+        self.max_workers = max(1, int(max_workers))
+        self.digest_filename = digest_filename
+        self._session = None
+
+    def __repr__(self):
+        return "Instance(%s, %s)" % (self.name, self.xmod_url)
+
+    @property
+    def session(self) -> requests.Session:
+        """Returns the HTTP session, creating it on first use"""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=self.max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.auth = self.auth
+            self._session = session
+        return self._session
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        """Performs a GET of path relative to the instance base URL
+
+        Args:
+            path (str): Resource path, starting with a /
+
+        Returns:
+            Response: response
+        """
+        return self.session.get(self.xmod_url + path, **kwargs)
+
+    def close(self):
+        """Releases the pooled connections held by the session"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()